@@ -4,18 +4,34 @@
 import os
 import re
 import time
+import asyncio
 import logging
-import tempfile
-import requests
-import pandas as pd
+import itertools
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from azure.core.exceptions import ResourceNotFoundError
 from azure.storage.blob import BlobServiceClient
 from dotenv import load_dotenv
 
-# ✅ Import extractor
-from extractor import extract_metadata_from_twbx
+# ✅ Import workbook model
+from workbook_model import get_workbook_model
+from hyper_engine import engine
+from push_engine import PushEngine, PUSH_BATCH_SIZE, PUSH_MAX_BATCH_BYTES
+from row_serializer import iter_json_batches
+from blob_stream import open_table_stream
+from schema_inference import infer_schema
+from refresh_manifest import (
+    APPEND, MANIFEST_VERSION, TableRefresh, definition_key, load_manifest,
+    manifest_blob_name, mark_in_progress, previous_tables, reusable_dataset,
+    save_manifest,
+)
+from token_provider import get_provider
+from powerbi_client import PowerBIClient, close_http
 
 # ============================================================
 # ENV + CONFIG
@@ -23,8 +39,6 @@ from extractor import extract_metadata_from_twbx
 
 load_dotenv()
 
-POWERBI_API = "https://api.powerbi.com/v1.0/myorg"
-
 TENANT_ID = os.getenv("TENANT_ID")
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
@@ -40,6 +54,12 @@ CSV_CONTAINER = os.getenv("CSV_CONTAINER")          # contains csvs
 
 REPORT_NAME = "Final_Sales_Report"
 
+BLOB_DOWNLOAD_CONCURRENCY = int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "4"))
+# Tables downloaded and parsed at the same time
+CSV_LOAD_WORKERS = int(os.getenv("CSV_LOAD_WORKERS", "4"))
+# When a table was extracted in both formats, the first one here wins
+TABLE_FORMAT_PREFERENCE = (".parquet", ".csv")
+
 # ============================================================
 # LOGGING
 # ============================================================
@@ -51,7 +71,16 @@ log = logging.getLogger("tableau-pbi-migrator")
 # FASTAPI APP
 # ============================================================
 
-app = FastAPI(title="Tableau → Power BI Migration")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One hyperd per worker, shared by every /migrate-static request
+    engine.start()
+    yield
+    await close_http()
+    engine.stop()
+
+
+app = FastAPI(title="Tableau → Power BI Migration", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -67,209 +96,381 @@ app.add_middleware(
 def extract_second_word_table_name(filename: str) -> str:
     """
     Extract_customers.csv_HASH -> customers
+    Extract_customers.parquet -> customers
     """
-    base = filename.split(".csv")[0]
+    base = re.split(r"\.(?:csv|parquet)", filename)[0]
     parts = base.split("_")
     table_name = parts[1] if len(parts) >= 2 else parts[0]
     return re.sub(r"[^a-zA-Z]", "", table_name).lower()
 
 
 def get_auth_token() -> str:
-    url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
+    # Cached per process and refreshed ahead of expiry
+    return get_provider().get_token()
+
+
+def progress_logger(label: str, step: int = 10):
+    """
+    progress_hook for blob downloads; logs every `step` percent
+    """
+    last = {"pct": -step}
+
+    def hook(current: int, total):
+        if not total:
+            return
+        pct = int(current * 100 / total)
+        if pct >= last["pct"] + step or current >= total:
+            last["pct"] = pct
+            log.info(f"Downloading {label}: {pct}% ({current}/{total} bytes)")
+
+    return hook
 
-    resp = requests.post(
-        url,
-        data={
-            "grant_type": "client_credentials",
-            "client_id": CLIENT_ID,
-            "client_secret": CLIENT_SECRET,
-            "scope": "https://analysis.windows.net/powerbi/api/.default",
-        },
-    )
 
-    resp.raise_for_status()
-    return resp.json()["access_token"]
+_blob_service = None
+_blob_service_lock = threading.Lock()
 
 
-def download_twbx_from_blob(folder_name: str) -> str:
+def get_blob_service() -> BlobServiceClient:
+    # One client (and connection pool) per process, shared by all requests
+    global _blob_service
+    with _blob_service_lock:
+        if _blob_service is None:
+            _blob_service = BlobServiceClient.from_connection_string(
+                AZURE_STORAGE_CONNECTION_STRING
+            )
+        return _blob_service
+
+
+def get_twbx_etag(folder_name: str) -> str:
     """
-    Downloads <folder_name>.twbx directly from TWBX container
+    ETag of <folder_name>.twbx, used as the workbook model key
     """
-    blob_service = BlobServiceClient.from_connection_string(
-        AZURE_STORAGE_CONNECTION_STRING
-    )
-    container = blob_service.get_container_client(TWBX_CONTAINER)
+    blob_service = get_blob_service()
+    twbx_blob_name = f"{folder_name}.twbx"
+    blob = blob_service.get_blob_client(TWBX_CONTAINER, twbx_blob_name)
+
+    try:
+        return blob.get_blob_properties().etag.strip('"')
+    except ResourceNotFoundError:
+        raise Exception(f"TWBX file not found: {twbx_blob_name}")
+
+
+def download_twbx_from_blob(folder_name: str, local_path: str):
+    """
+    Downloads <folder_name>.twbx directly from TWBX container to local_path
+    """
+    container = get_blob_service().get_container_client(TWBX_CONTAINER)
 
     twbx_blob_name = f"{folder_name}.twbx"
 
     try:
-        data = container.download_blob(twbx_blob_name).readall()
+        # Parallel ranged download streamed into the file
+        downloader = container.download_blob(
+            twbx_blob_name,
+            max_concurrency=BLOB_DOWNLOAD_CONCURRENCY,
+            progress_hook=progress_logger(twbx_blob_name),
+        )
 
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".twbx")
-        tmp.write(data)
-        tmp.close()
+        with open(local_path, "wb") as f:
+            downloader.readinto(f)
 
         log.info(f"Downloaded TWBX: {twbx_blob_name}")
-        return tmp.name
 
     except Exception:
         raise Exception(f"TWBX file not found: {twbx_blob_name}")
 
-# ============================================================
-# MIGRATION API
-# ============================================================
 
-@app.post("/migrate-static")
-def migrate_static(folder_name: str, target_workspace_id: str):
-    try:
-        # ----------------------------------------------------
-        # 1. AUTH
-        # ----------------------------------------------------
-        token = get_auth_token()
+def pick_table_blobs(blob_names) -> dict:
+    """
+    table -> blob name, one blob per table. /extract-data run once as CSV
+    and again as Parquet leaves both files; the preferred format is used
+    and the other one skipped.
+    """
+    def rank(blob_name: str) -> int:
+        return TABLE_FORMAT_PREFERENCE.index(os.path.splitext(blob_name)[1].lower())
+
+    picked = {}
+    for blob_name in blob_names:
+        filename = os.path.basename(blob_name)
+        if not filename.lower().endswith(TABLE_FORMAT_PREFERENCE):
+            continue
+
+        table_name = extract_second_word_table_name(filename)
+        current = picked.get(table_name)
+        if current is not None:
+            keep, skip = sorted((current, blob_name), key=rank)
+            log.warning(f"Table {table_name} found as {keep} and {skip}; skipping {skip}")
+            blob_name = keep
+        picked[table_name] = blob_name
+    return picked
+
+def load_migration_inputs(folder_name: str):
+    """
+    Blocking part of a migration: workbook model, table streams and the
+    dataset definition. Returns (container, table_blobs, table_streams,
+    schemas, dataset_payload).
+    """
+    # ----------------------------------------------------
+    # 2. WORKBOOK MODEL + TABLE DATA, FETCHED TOGETHER
+    # ----------------------------------------------------
+    # The TWBX and the CSVs do not depend on each other: the model is
+    # built while a bounded pool opens every table under the prefix and
+    # parses its first chunk. Tables the model does not use are dropped.
+    etag = get_twbx_etag(folder_name)
+    container = get_blob_service().get_container_client(CSV_CONTAINER)
+    prefix = f"{folder_name.rstrip('/')}/"
+
+    with ThreadPoolExecutor(max_workers=CSV_LOAD_WORKERS + 1) as pool:
+        model_future = pool.submit(
+            get_workbook_model,
+            TWBX_CONTAINER,
+            f"{folder_name}.twbx",
+            etag,
+            lambda local_path: download_twbx_from_blob(folder_name, local_path),
+        )
 
-        # ----------------------------------------------------
-        # 2. DOWNLOAD TWBX & EXTRACT METADATA
-        # ----------------------------------------------------
-        twbx_path = download_twbx_from_blob(folder_name)
-        metadata = extract_metadata_from_twbx(twbx_path)
-        os.remove(twbx_path)
+        table_blobs = pick_table_blobs(
+            blob.name for blob in container.list_blobs(name_starts_with=prefix)
+        )
+        table_futures = {
+            table_name: pool.submit(open_table_stream, container, blob_name)
+            for table_name, blob_name in table_blobs.items()
+        }
+
+        # ------------------------------------------------
+        # 3. KEEP TABLES USED BY THE MODEL'S RELATIONSHIPS
+        # ------------------------------------------------
+        metadata, _ = model_future.result()
+        if not metadata["tables"]:
+            raise ValueError("Invalid TWBX file: no Hyper extract found")
 
         relationships_metadata = metadata["relationships"]
         log.info("Extracted Tableau relationships")
 
-        # ----------------------------------------------------
-        # 3. READ CSVs FROM AZURE BLOB (METADATA DRIVEN)
-        # ----------------------------------------------------
-        blob_service = BlobServiceClient.from_connection_string(
-            AZURE_STORAGE_CONNECTION_STRING
-        )
-        container = blob_service.get_container_client(CSV_CONTAINER)
-
-        blob_tables = {}
-        prefix = f"{folder_name.rstrip('/')}/"
-
         valid_tables = set()
         for r in relationships_metadata:
             valid_tables.add(r["fromTable"])
             valid_tables.add(r["toTable"])
 
-        for blob in container.list_blobs(name_starts_with=prefix):
-            filename = os.path.basename(blob.name)
-
-            if not filename.lower().endswith(".csv"):
+        # table -> (first chunk, iterator over the remaining chunks).
+        # The first chunk drives the schema; the rest is streamed while
+        # pushing.
+        table_streams = {}
+        for table_name, future in table_futures.items():
+            if table_name not in valid_tables:
+                future.cancel()
                 continue
+            table_streams[table_name] = future.result()
+            log.info(f"Opened table stream: {table_name}")
+
+    # ----------------------------------------------------
+    # 4. BUILD POWER BI RELATIONSHIPS
+    # ----------------------------------------------------
+    pbi_relationships = []
+    for r in relationships_metadata:
+        pbi_relationships.append({
+            "name": f"{r['fromTable']}_{r['toTable']}",
+            "fromTable": r["fromTable"],
+            "fromColumn": r["fromColumn"],
+            "toTable": r["toTable"],
+            "toColumn": r["toColumn"],
+            "crossFilteringBehavior": "BothDirections",
+        })
+
+    # ----------------------------------------------------
+    # 5. DEFINE DATASET
+    # ----------------------------------------------------
+    dataset_payload = {
+        "name": f"{REPORT_NAME}_DS",
+        "defaultMode": "Push",
+        "tables": [],
+        "relationships": pbi_relationships,
+    }
+
+    # Relationship columns are keys and must not be summed
+    key_columns = {}
+    for r in relationships_metadata:
+        key_columns.setdefault(r["fromTable"], set()).add(r["fromColumn"])
+        key_columns.setdefault(r["toTable"], set()).add(r["toColumn"])
+
+    # Hyper keeps the table's case ("Orders"); blob-derived names and
+    # relationship tables are lowercase
+    column_types = {
+        table.lower(): info["columns"] for table, info in metadata["tables"].items()
+    }
+    schemas = {}
+
+    for table_name, (df, _) in table_streams.items():
+        # Typed from the Hyper extract where possible, else sampled
+        schemas[table_name] = infer_schema(
+            table_name,
+            df,
+            hyper_types=column_types.get(table_name),
+            key_columns=key_columns.get(table_name, ()),
+        )
+        dataset_payload["tables"].append(schemas[table_name].to_dataset_table())
 
-            table_name = extract_second_word_table_name(filename)
+    return container, table_blobs, table_streams, schemas, dataset_payload
 
-            if table_name not in valid_tables:
-                continue
 
-            data = container.download_blob(blob.name).readall()
-            blob_tables[table_name] = pd.read_csv(
-                pd.io.common.BytesIO(data)
-            )
+def plan_tables(container, table_blobs: dict, table_streams: dict, refreshes: dict) -> dict:
+    """
+    Per table: full push, append after the rows pushed last time, or
+    reload. Deciding reads the previously pushed rows, so it runs on a pool
+    like the initial load. Returns table -> frames to push.
+    """
+    def plan(item):
+        table_name, (first, rest) = item
+
+        def reopen():
+            first, rest = open_table_stream(container, table_blobs[table_name])
+            return itertools.chain([first], rest)
+
+        return refreshes[table_name].plan(itertools.chain([first], rest), reopen)
 
-            log.info(f"Loaded table: {table_name}")
+    streams = list(table_streams.items())
+    table_streams.clear()
+    with ThreadPoolExecutor(max_workers=CSV_LOAD_WORKERS) as pool:
+        return dict(zip(refreshes, pool.map(plan, streams)))
 
+# ============================================================
+# MIGRATION API
+# ============================================================
+
+@app.post("/migrate-static")
+async def migrate_static(folder_name: str, target_workspace_id: str, incremental: bool = False):
+    """
+    incremental: reuse the dataset of the last run for this folder and
+    workspace and push only rows appended since then. Tables whose earlier
+    rows changed are cleared and re-pushed; a changed dataset definition
+    (tables, columns, relationships) falls back to a new dataset.
+    """
+    try:
         # ----------------------------------------------------
-        # 4. BUILD POWER BI RELATIONSHIPS
+        # 1. AUTH
         # ----------------------------------------------------
-        pbi_relationships = []
-        for r in relationships_metadata:
-            pbi_relationships.append({
-                "name": f"{r['fromTable']}_{r['toTable']}",
-                "fromTable": r["fromTable"],
-                "fromColumn": r["fromColumn"],
-                "toTable": r["toTable"],
-                "toColumn": r["toColumn"],
-                "crossFilteringBehavior": "BothDirections",
-            })
+        # Tokens come from the shared provider on every request
+        client = PowerBIClient(get_auth_token)
 
         # ----------------------------------------------------
-        # 5. DEFINE DATASET
+        # 2-5. WORKBOOK MODEL, TABLE STREAMS, DATASET DEFINITION
         # ----------------------------------------------------
-        dataset_payload = {
-            "name": f"{REPORT_NAME}_DS",
-            "defaultMode": "Push",
-            "tables": [],
-            "relationships": pbi_relationships,
-        }
-
-        for table_name, df in blob_tables.items():
-            columns = []
-
-            for col in df.columns:
-                if "id" in col.lower():
-                    dtype, summarize = "Int64", "none"
-                elif df[col].dtype == "float64":
-                    dtype, summarize = "Double", "sum"
-                elif df[col].dtype == "int64":
-                    dtype, summarize = "Int64", "sum"
-                else:
-                    dtype, summarize = "string", "none"
-
-                columns.append({
-                    "name": col,
-                    "dataType": dtype,
-                    "summarizeBy": summarize,
-                })
-
-            dataset_payload["tables"].append({
-                "name": table_name,
-                "columns": columns,
-            })
+        # Blob reads, Hyper queries and parsing block; run them off the loop
+        container, table_blobs, table_streams, schemas, dataset_payload = (
+            await run_in_threadpool(load_migration_inputs, folder_name)
+        )
+        pbi_relationships = dataset_payload["relationships"]
 
         # ----------------------------------------------------
-        # 6. CREATE DATASET
+        # 6. CREATE (OR REUSE) DATASET
         # ----------------------------------------------------
-        ds_resp = requests.post(
-            f"{POWERBI_API}/groups/{target_workspace_id}/datasets",
-            headers={"Authorization": f"Bearer {token}"},
-            json=dataset_payload,
+        manifest_name = manifest_blob_name("migrate-static", folder_name, target_workspace_id)
+        definition = definition_key({
+            "tables": dataset_payload["tables"],
+            "relationships": pbi_relationships,
+        })
+        manifest = (
+            await run_in_threadpool(load_manifest, manifest_name) if incremental else None
         )
-        log.error("Power BI Dataset Create Status: %s", ds_resp.status_code)
-        log.error("Power BI Dataset Create Response: %s", ds_resp.text)
-        ds_resp.raise_for_status()
-
-        dataset_id = ds_resp.json()["id"]
-        log.info(f"Dataset created: {dataset_id}")
+        # Empty when the last push did not finish: every table is replaced
+        previous = previous_tables(manifest, definition)
+
+        dataset_id = None
+        reuse_id = reusable_dataset(manifest, definition)
+        if reuse_id:
+            if await client.get_dataset(target_workspace_id, reuse_id):
+                dataset_id = reuse_id
+                log.info(f"Refreshing dataset {dataset_id} incrementally")
+            else:
+                log.info("Dataset from the last run is gone; creating a new one")
+                previous = {}
+        reused = dataset_id is not None
+
+        if not reused:
+            dataset_id = await client.create_dataset(target_workspace_id, dataset_payload)
+            log.info(f"Dataset created: {dataset_id}")
+        dataset_created_at = time.monotonic()
 
         # ----------------------------------------------------
         # 7. PUSH DATA
         # ----------------------------------------------------
-        time.sleep(5)
+        push_engine = PushEngine(target_workspace_id, dataset_id, get_auth_token)
 
-        for table_name, df in blob_tables.items():
-            df_clean = df.where(pd.notnull(df), None)
-            rows = df_clean.to_dict(orient="records")
+        refreshes = {
+            table_name: TableRefresh(schemas[table_name], previous.get(table_name))
+            for table_name in table_streams
+        }
+        table_frames = await run_in_threadpool(
+            plan_tables, container, table_blobs, table_streams, refreshes
+        )
+
+        if reused:
+            # Until the new manifest is saved, the old one no longer
+            # describes the dataset's rows
+            await run_in_threadpool(mark_in_progress, manifest_name, manifest)
+            await asyncio.gather(*(
+                client.delete_rows(target_workspace_id, dataset_id, table_name)
+                for table_name, refresh in refreshes.items()
+                if refresh.mode != APPEND
+            ))
+        else:
+            # Start as soon as the dataset accepts requests instead of a fixed sleep
+            ready_after = await run_in_threadpool(push_engine.wait_until_ready)
+            log.info(f"Dataset ready after {ready_after:.2f}s")
+
+        def row_batches():
+            # Download, parse and push overlap; one chunk per table in memory
+            for table_name in list(table_frames):
+                for df in table_frames.pop(table_name):
+                    yield from iter_json_batches(
+                        table_name, df, PUSH_BATCH_SIZE,
+                        schema=schemas[table_name],
+                        max_bytes=PUSH_MAX_BATCH_BYTES,
+                    )
+
+        # PushEngine's pool and rate limiters are thread based; the batches
+        # are parsed and pushed off the loop
+        push_stats = await run_in_threadpool(push_engine.push, row_batches())
+        for table_name, refresh in refreshes.items():
+            stats = push_stats.setdefault(
+                table_name, {"rows": 0, "batches": 0, "seconds": 0, "rows_per_sec": 0}
+            )
+            stats["refresh"] = refresh.mode
+            stats["skipped_rows"] = refresh.skipped_rows
 
-            for i in range(0, len(rows), 2500):
-                requests.post(
-                    f"{POWERBI_API}/groups/{target_workspace_id}/datasets/{dataset_id}/tables/{table_name}/rows",
-                    headers={"Authorization": f"Bearer {token}"},
-                    json={"rows": rows[i:i + 2500]},
-                ).raise_for_status()
+        time_to_first_row = None
+        if push_engine.first_row_at is not None:
+            time_to_first_row = round(push_engine.first_row_at - dataset_created_at, 3)
 
-            log.info(f"Pushed {len(rows)} rows into {table_name}")
+        for table_name, stats in push_stats.items():
+            log.info(f"Pushed {stats['rows']} rows into {table_name} ({stats['rows_per_sec']} rows/s)")
 
         # ----------------------------------------------------
-        # 8. CLONE REPORT
+        # 8. CLONE REPORT (NEW DATASET ONLY)
         # ----------------------------------------------------
-        clone_resp = requests.post(
-            f"{POWERBI_API}/groups/{TEMPLATE_WORKSPACE_ID}/reports/{TEMPLATE_REPORT_ID}/Clone",
-            headers={"Authorization": f"Bearer {token}"},
-            json={
-                "name": REPORT_NAME,
-                "targetWorkspaceId": target_workspace_id,
-                "targetModelId": dataset_id,
-            },
-        )
-        clone_resp.raise_for_status()
+        if reused and manifest.get("reportId"):
+            report_id = manifest["reportId"]
+        else:
+            report_id = await client.clone_report(
+                TEMPLATE_WORKSPACE_ID, TEMPLATE_REPORT_ID, REPORT_NAME,
+                target_workspace_id, dataset_id,
+            )
+
+        await run_in_threadpool(save_manifest, manifest_name, {
+            "version": MANIFEST_VERSION,
+            "datasetId": dataset_id,
+            "reportId": report_id,
+            "definition": definition,
+            "tables": {name: refresh.entry() for name, refresh in refreshes.items()},
+        })
 
         return {
             "status": "SUCCESS",
             "dataset_id": dataset_id,
-            "report_id": clone_resp.json()["id"],
+            "report_id": report_id,
+            "dataset_reused": reused,
+            "tables": push_stats,
+            "time_to_first_row_seconds": time_to_first_row,
             "message": "TWBX metadata + data migrated successfully",
         }
 
@@ -277,5 +478,3 @@ def migrate_static(folder_name: str, target_workspace_id: str):
         log.exception("Migration failed")
         raise HTTPException(status_code=500, detail=str(e))
 
-
-
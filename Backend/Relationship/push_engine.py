@@ -0,0 +1,320 @@
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+log = logging.getLogger("tableau-pbi-migrator")
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+POWERBI_API = "https://api.powerbi.com/v1.0/myorg"
+
+PUSH_BATCH_SIZE = int(os.getenv("PBI_PUSH_BATCH_SIZE", "2500"))
+# Batches whose JSON body is larger than this are split further
+PUSH_MAX_BATCH_BYTES = int(os.getenv("PBI_PUSH_MAX_BATCH_BYTES", str(4 * 1024 * 1024)))
+PUSH_WORKERS = int(os.getenv("PBI_PUSH_WORKERS", "4"))
+PUSH_TIMEOUT = float(os.getenv("PBI_PUSH_TIMEOUT", "60"))
+PUSH_MAX_RETRIES = int(os.getenv("PBI_PUSH_MAX_RETRIES", "6"))
+
+# Power BI push dataset limits (per dataset)
+MAX_REQUESTS_PER_MINUTE = int(os.getenv("PBI_MAX_REQUESTS_PER_MINUTE", "120"))
+MAX_ROWS_PER_HOUR = int(os.getenv("PBI_MAX_ROWS_PER_HOUR", "1000000"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Retried on server errors and timeouts too. A POST that timed out or got
+# a 5xx may already have been applied, and push tables only append, so
+# it is retried only on 429 or when it never reached the server.
+IDEMPOTENT_METHODS = {"GET", "PUT", "DELETE", "HEAD"}
+
+# Readiness probe after dataset creation
+DATASET_READY_TIMEOUT = float(os.getenv("PBI_DATASET_READY_TIMEOUT", "60"))
+DATASET_READY_MAX_INTERVAL = float(os.getenv("PBI_DATASET_READY_MAX_INTERVAL", "2"))
+
+# ============================================================
+# HTTP SESSION
+# ============================================================
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    # One pooled session per process, shared by every migration
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=PUSH_WORKERS,
+                pool_maxsize=PUSH_WORKERS * 4,
+            )
+            _session.mount("https://", adapter)
+        return _session
+
+# ============================================================
+# RATE LIMITING
+# ============================================================
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `capacity`
+    stored. acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        # Requests bigger than the bucket would wait forever
+        amount = min(amount, self.capacity)
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+
+                wait = (amount - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+# ============================================================
+# RETRIES
+# ============================================================
+
+def _retry_delay(resp, attempt: int) -> float:
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    # Exponential backoff with jitter, capped at one minute
+    return min(60, 2 ** attempt) + random.uniform(0, 1)
+
+
+def _not_sent(error: Exception) -> bool:
+    # Failed while connecting, so the server never saw the request
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def request_with_retry(method: str, url: str, headers: dict,
+                       timeout: float = PUSH_TIMEOUT,
+                       max_retries: int = PUSH_MAX_RETRIES, **kwargs):
+    session = get_session()
+    method = method.upper()
+    idempotent = method in IDEMPOTENT_METHODS
+
+    for attempt in range(max_retries + 1):
+        resp = None
+        try:
+            resp = session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # Otherwise raised, and the push checkpoint decides what to resend
+            if attempt == max_retries or not (idempotent or _not_sent(e)):
+                raise
+        else:
+            retryable = resp.status_code == 429 or (
+                idempotent and resp.status_code in RETRY_STATUS
+            )
+            if not retryable or attempt == max_retries:
+                resp.raise_for_status()
+                return resp
+
+        delay = _retry_delay(resp, attempt)
+        log.warning(
+            "Push retry %s/%s in %.1fs (status %s)",
+            attempt + 1, max_retries, delay,
+            resp.status_code if resp is not None else "network error",
+        )
+        time.sleep(delay)
+
+
+def post_with_retry(url: str, headers: dict, **kwargs):
+    return request_with_retry("POST", url, headers, **kwargs)
+
+# ============================================================
+# PUSH ENGINE
+# ============================================================
+
+class PushEngine:
+    """
+    Pushes row batches for one push dataset. Batches are sent in the order
+    given, several at a time on a bounded pool over the shared session, so
+    consecutive tables only overlap at their boundary; the rate limits are
+    per dataset, not per table. Every request goes through the per-dataset
+    request and row rate limiters.
+    """
+
+    def __init__(self, workspace_id: str, dataset_id: str, token,
+                 workers: int = PUSH_WORKERS):
+        # token: bearer string, or a zero-arg callable returning one so long
+        # pushes pick up refreshed tokens
+        self.workspace_id = workspace_id
+        self.dataset_id = dataset_id
+        self.token = token
+        self.workers = workers
+
+        self.request_limiter = TokenBucket(
+            MAX_REQUESTS_PER_MINUTE / 60.0, MAX_REQUESTS_PER_MINUTE
+        )
+        self.row_limiter = TokenBucket(
+            MAX_ROWS_PER_HOUR / 3600.0, MAX_ROWS_PER_HOUR
+        )
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self.first_row_at = None
+
+    def _auth(self) -> str:
+        token = self.token() if callable(self.token) else self.token
+        return f"Bearer {token}"
+
+    def _url(self, table_name: str) -> str:
+        return (
+            f"{POWERBI_API}/groups/{self.workspace_id}"
+            f"/datasets/{self.dataset_id}/tables/{table_name}/rows"
+        )
+
+    def _record(self, table_name: str, rows: int, started: float, finished: float):
+        with self._stats_lock:
+            stats = self._stats.setdefault(table_name, {
+                "rows": 0, "batches": 0, "started": started, "finished": finished
+            })
+            if self.first_row_at is None:
+                self.first_row_at = finished
+            stats["rows"] += rows
+            stats["batches"] += 1
+            stats["started"] = min(stats["started"], started)
+            stats["finished"] = max(stats["finished"], finished)
+
+    def wait_until_ready(self, timeout: float = DATASET_READY_TIMEOUT) -> float:
+        """
+        Polls the dataset's tables endpoint until it answers, starting at
+        0.1s and doubling up to DATASET_READY_MAX_INTERVAL. Returns the
+        seconds waited; raises TimeoutError after `timeout`.
+        """
+        session = get_session()
+        url = (
+            f"{POWERBI_API}/groups/{self.workspace_id}"
+            f"/datasets/{self.dataset_id}/tables"
+        )
+        started = time.monotonic()
+        interval = 0.1
+
+        while True:
+            try:
+                resp = session.get(
+                    url,
+                    headers={"Authorization": self._auth()},
+                    timeout=PUSH_TIMEOUT,
+                )
+                if resp.status_code == 200 and resp.json().get("value"):
+                    return time.monotonic() - started
+                status = resp.status_code
+            except (requests.ConnectionError, requests.Timeout, ValueError):
+                status = "network error"
+
+            waited = time.monotonic() - started
+            if waited + interval > timeout:
+                raise TimeoutError(
+                    f"Dataset {self.dataset_id} not ready after {waited:.1f}s "
+                    f"(last status {status})"
+                )
+
+            time.sleep(interval)
+            interval = min(interval * 2, DATASET_READY_MAX_INTERVAL)
+
+    def push_batch(self, table_name: str, row_count: int, body: bytes):
+        # body is a pre-serialized {"rows": [...]} JSON document
+        self.row_limiter.acquire(row_count)
+        self.request_limiter.acquire()
+
+        started = time.monotonic()
+        post_with_retry(
+            self._url(table_name),
+            headers={
+                "Authorization": self._auth(),
+                "Content-Type": "application/json",
+            },
+            data=body,
+        )
+        self._record(table_name, row_count, started, time.monotonic())
+
+    def push(self, batches, on_batch=None) -> dict:
+        """
+        batches: iterable of (table_name, row_count, body), e.g. from
+        row_serializer.iter_json_batches. Returns per-table stats.
+        on_batch(position, table_name, row_count) is called from the worker
+        once a batch is acknowledged; position counts batches as consumed.
+        The first failed batch stops the push: nothing more is submitted,
+        queued batches are cancelled and its error is raised.
+        """
+        # Cap in-flight batches so a lazy batch source is not drained upfront
+        max_in_flight = self.workers * 2
+        pending = set()
+
+        def run(position, table_name, row_count, body):
+            self.push_batch(table_name, row_count, body)
+            if on_batch is not None:
+                on_batch(position, table_name, row_count)
+
+        def reap(block: bool):
+            nonlocal pending
+            done, pending = wait(
+                pending, timeout=None if block else 0, return_when=FIRST_COMPLETED
+            )
+            for f in done:
+                f.result()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for position, (table_name, row_count, body) in enumerate(batches):
+                    reap(block=len(pending) >= max_in_flight)
+                    pending.add(
+                        pool.submit(run, position, table_name, row_count, body)
+                    )
+
+                while pending:
+                    reap(block=True)
+            except BaseException:
+                # Batches already sending finish; queued ones never start
+                for f in pending:
+                    f.cancel()
+                raise
+
+        return self.summary()
+
+    def summary(self) -> dict:
+        with self._stats_lock:
+            result = {}
+            for table_name, stats in self._stats.items():
+                seconds = max(stats["finished"] - stats["started"], 1e-6)
+                result[table_name] = {
+                    "rows": stats["rows"],
+                    "batches": stats["batches"],
+                    "seconds": round(seconds, 3),
+                    "rows_per_sec": round(stats["rows"] / seconds, 1),
+                }
+            return result
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+RESULT_CACHE_DIR = os.getenv(
+    "RESULT_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "twbx-result-cache")
+)
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+
+DATA_FILE = "result.json"
+
+# ============================================================
+# CACHE
+# ============================================================
+
+class ResultCache:
+    """
+    Size-bounded LRU cache on local disk. Each entry is a directory named
+    after the key, holding result.json plus any files stored with it.
+    Recency is tracked through the entry directory's mtime.
+    """
+
+    def __init__(self, root: str = RESULT_CACHE_DIR,
+                 max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        # e.g. key(blob_path, etag, output_format)
+        raw = "\x1f".join(str(p) for p in parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str):
+        """
+        Returns (data, files) for a hit, None for a miss.
+        """
+        entry = self._entry(key)
+        data_path = os.path.join(entry, DATA_FILE)
+
+        with self._lock:
+            if not os.path.exists(data_path):
+                return None
+
+            try:
+                with open(data_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                shutil.rmtree(entry, ignore_errors=True)
+                return None
+
+            now = time.time()
+            os.utime(entry, (now, now))
+
+            files = sorted(
+                os.path.join(entry, name)
+                for name in os.listdir(entry)
+                if name != DATA_FILE
+            )
+            return data, files
+
+    def put(self, key: str, data: dict, files: list = None):
+        entry = self._entry(key)
+        staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+
+        try:
+            for path in files or []:
+                target = os.path.join(staging, os.path.basename(path))
+                try:
+                    # Hard link when possible, the cache usually shares a disk
+                    os.link(path, target)
+                except OSError:
+                    shutil.copy2(path, target)
+
+            with open(os.path.join(staging, DATA_FILE), "w", encoding="utf-8") as f:
+                json.dump(data, f)
+
+            with self._lock:
+                shutil.rmtree(entry, ignore_errors=True)
+                os.replace(staging, entry)
+                self._evict()
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def _size(self, path: str) -> int:
+        total = 0
+        for root_dir, _, names in os.walk(path):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(root_dir, name))
+                except OSError:
+                    pass
+        return total
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if name.startswith(".staging-"):
+                continue
+            path = os.path.join(self.root, name)
+            entries.append((os.path.getmtime(path), self._size(path), path))
+
+        total = sum(size for _, size, _ in entries)
+
+        # Oldest access first
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+cache = ResultCache()
@@ -0,0 +1,72 @@
+from decimal import Decimal
+
+import pandas as pd
+
+DEFAULT_BATCH_SIZE = 2500
+
+
+def _normalize_objects(part: pd.DataFrame) -> pd.DataFrame:
+    # Decimal values (e.g. NUMERIC columns from Parquet) would otherwise be
+    # serialized as strings; Power BI expects JSON numbers for them.
+    converted = None
+    for col in part.columns:
+        if part[col].dtype != object:
+            continue
+        sample = part[col].dropna()
+        if not sample.empty and isinstance(sample.iloc[0], Decimal):
+            if converted is None:
+                converted = part.copy()
+            converted[col] = pd.to_numeric(part[col], errors="coerce")
+    return part if converted is None else converted
+
+
+def serialize_rows(part: pd.DataFrame, as_string: bool = False) -> bytes:
+    """
+    One DataFrame slice -> '{"rows": [...]}' request body.
+    Uses pandas' C JSON writer: NaN/NaT become null, datetimes are ISO 8601,
+    numpy scalars are written natively.
+    """
+    if as_string:
+        # Nullable string dtype keeps missing values as null instead of "nan"
+        part = part.astype("string")
+    else:
+        part = _normalize_objects(part)
+
+    records = part.to_json(
+        orient="records",
+        date_format="iso",
+        double_precision=15,
+        force_ascii=False,
+    )
+    return ('{"rows":' + records + '}').encode("utf-8")
+
+
+def _sized_batches(table_name: str, part: pd.DataFrame, as_string: bool,
+                   max_bytes: int):
+    body = serialize_rows(part, as_string)
+    if max_bytes and len(body) > max_bytes and len(part) > 1:
+        # Too large for one request: split the slice in half
+        mid = len(part) // 2
+        yield from _sized_batches(table_name, part.iloc[:mid], as_string, max_bytes)
+        yield from _sized_batches(table_name, part.iloc[mid:], as_string, max_bytes)
+        return
+    yield table_name, len(part), body
+
+
+def iter_json_batches(table_name: str, df: pd.DataFrame,
+                      batch_size: int = DEFAULT_BATCH_SIZE,
+                      as_string: bool = False, schema=None,
+                      max_bytes: int = None):
+    """
+    Yields (table_name, row_count, body) per batch, serializing one slice
+    at a time so only a single batch body is built at once. With a
+    schema_inference.TableSchema the frame is first coerced to its types.
+    Batches are at most `batch_size` rows and, when given, `max_bytes`
+    of JSON; the split is deterministic for the same frame.
+    """
+    if schema is not None:
+        df = schema.coerce(df)
+
+    for start in range(0, len(df), batch_size):
+        part = df.iloc[start:start + batch_size]
+        yield from _sized_batches(table_name, part, as_string, max_bytes)
@@ -0,0 +1,212 @@
+import os
+import re
+import logging
+import warnings
+
+import pandas as pd
+from pandas.api import types as ptypes
+
+from pbi_types import (
+    BOOLEAN, DATETIME, DOUBLE, INT64, NUMERIC_TYPES, STRING, is_key_name,
+)
+
+log = logging.getLogger("schema-inference")
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+# Rows per table looked at when guessing column types
+SCHEMA_SAMPLE_ROWS = int(os.getenv("SCHEMA_SAMPLE_ROWS", "10000"))
+# Share of non-null sample values that must parse for a typed column;
+# values that do not parse are pushed as null
+SCHEMA_MIN_CONFIDENCE = float(os.getenv("SCHEMA_MIN_CONFIDENCE", "0.99"))
+
+_BOOL_VALUES = {"true": True, "false": False, "yes": True, "no": False}
+
+# Codes such as zip codes lose their leading zeros as numbers
+_LEADING_ZERO = re.compile(r"^0\d")
+_DATE_LIKE = re.compile(r"[-/:]")
+
+
+def _to_datetime(values: pd.Series) -> pd.Series:
+    # ISO 8601 (what the extractor writes) is vectorized; anything else
+    # falls back to per-value parsing
+    parsed = pd.to_datetime(values, errors="coerce", format="ISO8601")
+    if parsed.notna().sum() == values.notna().sum():
+        return parsed
+
+    with warnings.catch_warnings():
+        # "Could not infer format" is expected for free text
+        warnings.simplefilter("ignore", UserWarning)
+        return pd.to_datetime(values, errors="coerce", format="mixed")
+
+# ============================================================
+# SCHEMA
+# ============================================================
+
+class ColumnSchema:
+    def __init__(self, name: str, data_type: str, summarize_by: str = "none",
+                 confidence: float = 1.0, source: str = "sample"):
+        self.name = name
+        self.data_type = data_type
+        self.summarize_by = summarize_by
+        self.confidence = confidence
+        self.source = source
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "dataType": self.data_type,
+            "summarizeBy": self.summarize_by,
+        }
+
+
+class TableSchema:
+    """
+    Column types for one push-dataset table. Used for the dataset payload
+    (to_dataset_table) and to coerce every DataFrame chunk before it is
+    serialized, so rows match the declared types.
+    """
+
+    def __init__(self, name: str, columns: list):
+        self.name = name
+        self.columns = columns
+
+    def to_dataset_table(self) -> dict:
+        return {
+            "name": self.name,
+            "columns": [c.to_dict() for c in self.columns],
+        }
+
+    def coerce(self, df: pd.DataFrame) -> pd.DataFrame:
+        out = {}
+        for col in self.columns:
+            if col.name not in df.columns:
+                continue
+            values = df[col.name]
+            converted = _coerce_series(values, col.data_type)
+
+            lost = int(values.notna().sum() - converted.notna().sum())
+            if lost:
+                log.warning(
+                    "%s.%s: %s values did not parse as %s and were nulled",
+                    self.name, col.name, lost, col.data_type,
+                )
+            out[col.name] = converted
+
+        return pd.DataFrame(out, index=df.index)
+
+
+def _coerce_series(values: pd.Series, data_type: str) -> pd.Series:
+    if data_type == INT64:
+        if ptypes.is_integer_dtype(values):
+            return values.astype("Int64")
+        nums = pd.to_numeric(values, errors="coerce")
+        # Fractional values cannot be pushed into an Int64 column
+        nums = nums.where(nums.isna() | (nums % 1 == 0))
+        return nums.astype("Int64")
+
+    if data_type == DOUBLE:
+        return pd.to_numeric(values, errors="coerce").astype("float64")
+
+    if data_type == BOOLEAN:
+        if ptypes.is_bool_dtype(values):
+            return values.astype("boolean")
+        lowered = values.astype("string").str.strip().str.lower()
+        return lowered.map(_BOOL_VALUES).astype("boolean")
+
+    if data_type == DATETIME:
+        if ptypes.is_datetime64_any_dtype(values):
+            return values
+        return _to_datetime(values)
+
+    return values.astype("string")
+
+# ============================================================
+# INFERENCE
+# ============================================================
+
+def _summarize(name: str, data_type: str, key_columns) -> str:
+    if data_type in NUMERIC_TYPES and name not in key_columns and not is_key_name(name):
+        return "sum"
+    return "none"
+
+
+def infer_column(name: str, values: pd.Series,
+                 min_confidence: float = SCHEMA_MIN_CONFIDENCE):
+    """
+    Returns (data_type, confidence) for one sampled column. Codes with
+    leading zeros are only recognised in text, which is why CSV chunks are
+    read with dtype=str.
+    """
+    original_count = len(values)
+    values = values.dropna()
+    if values.empty:
+        return STRING, 1.0
+
+    if ptypes.is_bool_dtype(values):
+        return BOOLEAN, 1.0
+    if ptypes.is_integer_dtype(values):
+        return INT64, 1.0
+    if ptypes.is_float_dtype(values):
+        # Integer columns with missing values are read as float
+        if len(values) < original_count and (values % 1 == 0).all():
+            return INT64, 1.0
+        return DOUBLE, 1.0
+    if ptypes.is_datetime64_any_dtype(values):
+        return DATETIME, 1.0
+
+    # Text (or mixed objects such as Decimal/date from Parquet)
+    text = values.astype(str).str.strip()
+    text = text[text != ""]
+    if text.empty:
+        return STRING, 1.0
+
+    ratio = text.str.lower().isin(_BOOL_VALUES).mean()
+    if ratio >= min_confidence:
+        return BOOLEAN, ratio
+
+    if not text.str.match(_LEADING_ZERO).any():
+        nums = pd.to_numeric(text, errors="coerce")
+        ratio = nums.notna().mean()
+        if ratio >= min_confidence:
+            parsed = nums.dropna()
+            integral = (parsed % 1 == 0).all() and parsed.abs().max() < 2 ** 63
+            return (INT64 if integral else DOUBLE), ratio
+
+    if text.str.contains(_DATE_LIKE).mean() >= min_confidence:
+        ratio = _to_datetime(text).notna().mean()
+        if ratio >= min_confidence:
+            return DATETIME, ratio
+
+    return STRING, 1.0
+
+
+def infer_schema(name: str, df: pd.DataFrame, hyper_types: dict = None,
+                 key_columns=(), sample_rows: int = SCHEMA_SAMPLE_ROWS,
+                 min_confidence: float = SCHEMA_MIN_CONFIDENCE) -> TableSchema:
+    """
+    Samples the first `sample_rows` rows of `df`. Column types from the
+    Hyper extract (hyper_types: column -> Power BI type) win over guesses.
+    Numeric columns summarize by sum unless they look like keys.
+    """
+    hyper_types = hyper_types or {}
+    key_columns = set(key_columns)
+    sample = df.head(sample_rows)
+
+    columns = []
+    for raw in df.columns:
+        col = str(raw)
+        if col in hyper_types:
+            data_type, confidence, source = hyper_types[col], 1.0, "hyper"
+        else:
+            data_type, confidence = infer_column(col, sample[raw], min_confidence)
+            source = "sample"
+
+        columns.append(ColumnSchema(
+            col, data_type, _summarize(col, data_type, key_columns),
+            confidence=round(float(confidence), 4), source=source,
+        ))
+
+    return TableSchema(name, columns)
@@ -0,0 +1,41 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_stream import open_table_stream
+from row_serializer import iter_json_batches
+from schema_inference import infer_schema
+
+
+class FakeDownloader:
+    def __init__(self, data):
+        self.data = data
+
+    def chunks(self):
+        return iter([self.data])
+
+
+class FakeContainer:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def download_blob(self, name, **kwargs):
+        return FakeDownloader(self.blobs[name])
+
+
+def pushed_rows(name, df, schema):
+    rows = []
+    for _, _, body in iter_json_batches(name, df, schema=schema):
+        rows.extend(json.loads(body)["rows"])
+    return rows
+
+
+def test_hyper_string_column_keeps_csv_text():
+    container = FakeContainer({"f/Extract_orders.csv": b"code,qty\n00501,2\n"})
+
+    df, _ = open_table_stream(container, "f/Extract_orders.csv")
+    schema = infer_schema("orders", df, hyper_types={"code": "string", "qty": "Int64"})
+
+    assert pushed_rows("orders", df, schema) == [{"code": "00501", "qty": 2}]
@@ -0,0 +1,71 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+class FakeBlob:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeDownloader:
+    def __init__(self, data):
+        self.data = data
+
+    def chunks(self):
+        return iter([self.data])
+
+    def readall(self):
+        return self.data
+
+
+class FakeContainer:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def list_blobs(self, name_starts_with):
+        return [FakeBlob(n) for n in self.blobs if n.startswith(name_starts_with)]
+
+    def download_blob(self, name, **kwargs):
+        return FakeDownloader(self.blobs[name])
+
+
+class FakeService:
+    def __init__(self, container):
+        self.container = container
+
+    def get_container_client(self, name):
+        return self.container
+
+
+def test_mixed_case_hyper_tables_keep_their_types(monkeypatch):
+    # Codes look numeric in the CSV but are text in the extract
+    container = FakeContainer({
+        "f/Extract_Orders_1.csv": b"order_id,customer_id,code\n1,1,001\n2,2,002\n",
+        "f/Extract_Customers_2.csv": b"customer_id,name\n1,a\n2,b\n",
+    })
+    metadata = {
+        "tables": {
+            "Orders": {"columns": {
+                "order_id": "Int64", "customer_id": "Int64", "code": "string",
+            }},
+            "Customers": {"columns": {"customer_id": "Int64", "name": "string"}},
+        },
+        "relationships": [{
+            "fromTable": "orders", "fromColumn": "customer_id",
+            "toTable": "customers", "toColumn": "customer_id",
+        }],
+    }
+    monkeypatch.setattr(main, "get_blob_service", lambda: FakeService(container))
+    monkeypatch.setattr(main, "get_twbx_etag", lambda folder: "etag")
+    monkeypatch.setattr(main, "get_workbook_model", lambda *args: (metadata, "built"))
+
+    _, _, _, schemas, _ = main.load_migration_inputs("f")
+
+    assert set(schemas) == {"orders", "customers"}
+    orders = {c.name: c for c in schemas["orders"].columns}
+    assert orders["code"].data_type == "string"
+    assert all(c.source == "hyper" for c in orders.values())
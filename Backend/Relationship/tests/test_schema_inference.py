@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_stream import open_table_stream
+from row_serializer import iter_json_batches
+from schema_inference import infer_schema
+
+
+class FakeDownloader:
+    def __init__(self, data):
+        self.data = data
+
+    def chunks(self):
+        return iter([self.data])
+
+
+class FakeContainer:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def download_blob(self, name, **kwargs):
+        return FakeDownloader(self.blobs[name])
+
+
+def test_csv_zip_codes_infer_string_and_keep_zeros():
+    container = FakeContainer({
+        "f/Extract_stores.csv": b"zip,sales\n00501,10\n02134,12.5\n",
+    })
+
+    df, _ = open_table_stream(container, "f/Extract_stores.csv")
+    schema = infer_schema("stores", df)
+
+    types = {c.name: c.data_type for c in schema.columns}
+    assert types == {"zip": "string", "sales": "Double"}
+
+    rows = []
+    for _, _, body in iter_json_batches("stores", df, schema=schema):
+        rows.extend(json.loads(body)["rows"])
+    assert [r["zip"] for r in rows] == ["00501", "02134"]
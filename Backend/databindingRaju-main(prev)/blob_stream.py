@@ -0,0 +1,77 @@
+import io
+import os
+from io import BytesIO
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+# Rows parsed per chunk; bounds memory per table while streaming
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "50000"))
+CSV_READ_BUFFER = 1024 * 1024
+
+# ============================================================
+# STREAMING
+# ============================================================
+
+class BlobChunkStream(io.RawIOBase):
+    """
+    Read-only file object over StorageStreamDownloader.chunks(), so the
+    blob is fetched range by range while the parser consumes it.
+    """
+
+    def __init__(self, downloader):
+        self._chunks = downloader.chunks()
+        self._buf = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            try:
+                self._buf = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def iter_table_chunks(container, blob_name: str, chunksize: int = CSV_CHUNK_ROWS):
+    """
+    Yields DataFrames of at most `chunksize` rows from a CSV or Parquet blob.
+    A file with no rows yields a single empty frame.
+    """
+    downloader = container.download_blob(blob_name)
+
+    if blob_name.lower().endswith(".parquet"):
+        # Parquet needs a seekable source; the compressed file is held,
+        # but rows are still converted one batch at a time
+        parquet = pq.ParquetFile(BytesIO(downloader.readall()))
+        if parquet.metadata.num_rows == 0:
+            yield parquet.schema_arrow.empty_table().to_pandas()
+            return
+        for batch in parquet.iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+
+    # Read as text: pandas would turn codes such as "00501" into numbers
+    # before the schema is known. TableSchema.coerce applies the types.
+    stream = io.BufferedReader(BlobChunkStream(downloader), CSV_READ_BUFFER)
+    with pd.read_csv(stream, chunksize=chunksize, dtype=str) as reader:
+        yield from reader
+
+
+def open_table_stream(container, blob_name: str, chunksize: int = CSV_CHUNK_ROWS):
+    """
+    Downloads and parses the first chunk of a table blob. Returns
+    (first_chunk, iterator over the remaining chunks).
+    """
+    chunks = iter_table_chunks(container, blob_name, chunksize)
+    return next(chunks), chunks
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+from blob_stream import CSV_CHUNK_ROWS
+
+log = logging.getLogger("excel-reader")
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+# Parsed workbooks, one directory of Parquet parts per blob version
+EXCEL_SPOOL_DIR = os.getenv(
+    "EXCEL_SPOOL_DIR",
+    os.path.join(tempfile.gettempdir(), "excel-spool")
+)
+# Spooled workbooks not used for this long are removed
+EXCEL_SPOOL_TTL = float(os.getenv("EXCEL_SPOOL_TTL", str(7 * 24 * 3600)))
+
+MANIFEST = "manifest.json"
+
+# ============================================================
+# SHEET READING
+# ============================================================
+
+def _header(row) -> list:
+    # Same names pandas would give: blanks become "Unnamed: i",
+    # repeats get a ".n" suffix
+    names, seen = [], {}
+    for i, value in enumerate(row):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _to_arrow(df: pd.DataFrame) -> pa.Table:
+    # Cells of one column can hold different types (numbers typed over
+    # text, error strings such as #N/A); such columns are kept as text
+    for col in df.columns:
+        if df[col].dtype == object:
+            kind = pd.api.types.infer_dtype(df[col], skipna=True)
+            if kind.startswith("mixed") and kind != "mixed-integer-float":
+                df[col] = df[col].map(lambda v: v if v is None else str(v))
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _iter_xlsx_sheets(path: str, chunksize: int):
+    """
+    Yields (sheet_name, header, iterator over DataFrames) using openpyxl's
+    read-only mode, which streams rows from the sheet XML instead of
+    building the whole workbook in memory.
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = None
+            for row in rows:
+                if any(v is not None for v in row):
+                    header = _header(row)
+                    break
+            if header is None:
+                log.info("Skipping empty sheet %s", sheet.title)
+                continue
+
+            def frames(rows=rows, header=header):
+                width, batch = len(header), []
+                for row in rows:
+                    if not any(v is not None for v in row):
+                        continue
+                    row = list(row[:width])
+                    row += [None] * (width - len(row))
+                    batch.append(row)
+                    if len(batch) >= chunksize:
+                        yield pd.DataFrame(batch, columns=header)
+                        batch = []
+                if batch:
+                    yield pd.DataFrame(batch, columns=header)
+
+            yield sheet.title, header, frames()
+    finally:
+        workbook.close()
+
+
+def _iter_xls_sheets(path: str, chunksize: int):
+    # Legacy .xls is capped at 65,536 rows per sheet, so each sheet is
+    # read whole and sliced
+    for name, df in pd.read_excel(path, sheet_name=None).items():
+        if df.empty and len(df.columns) == 0:
+            log.info("Skipping empty sheet %s", name)
+            continue
+        frames = (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+        yield name, [str(c) for c in df.columns], frames
+
+# ============================================================
+# SPOOL
+# ============================================================
+
+def _spool_key(blob_name: str, etag: str) -> str:
+    raw = f"{blob_name}\x1f{etag}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _prune(root: str, keep: str):
+    cutoff = time.time() - EXCEL_SPOOL_TTL
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry)
+        if entry != keep and os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_spool(downloaded: str, target: str, excel_name: str, chunksize: int) -> list:
+    reader = _iter_xls_sheets if excel_name.lower().endswith(".xls") else _iter_xlsx_sheets
+
+    sheets = []
+    for index, (sheet_name, columns, frames) in enumerate(reader(downloaded, chunksize)):
+        parts, rows = [], 0
+        for df in frames:
+            part = f"sheet{index:03d}-{len(parts):05d}.parquet"
+            pq.write_table(_to_arrow(df), os.path.join(target, part))
+            parts.append(part)
+            rows += len(df)
+
+        sheets.append({
+            "name": sheet_name,
+            "rows": rows,
+            "parts": parts,
+            "columns": columns,
+        })
+    return sheets
+
+
+def spool_workbook(container, blob_name: str, etag: str,
+                   chunksize: int = CSV_CHUNK_ROWS,
+                   root: str = EXCEL_SPOOL_DIR) -> list:
+    """
+    Converts every sheet of an Excel blob to Parquet parts of at most
+    `chunksize` rows, once per blob version (name + ETag). Later calls for
+    the same version skip the download and the Excel parse.
+    Returns [{"name", "rows", "parts", "columns", "dir"}] in sheet order;
+    sheets without any cells are left out.
+    """
+    os.makedirs(root, exist_ok=True)
+    key = _spool_key(blob_name, etag)
+    final = os.path.join(root, key)
+    manifest = os.path.join(final, MANIFEST)
+
+    if os.path.exists(manifest):
+        os.utime(final)
+        with open(manifest, "r", encoding="utf-8") as f:
+            sheets = json.load(f)["sheets"]
+        log.info("Using spooled %s (%s sheets)", blob_name, len(sheets))
+    else:
+        started = time.perf_counter()
+        work = tempfile.mkdtemp(dir=root, prefix=f"{key}.")
+        try:
+            downloaded = os.path.join(work, "source" + os.path.splitext(blob_name)[1])
+            with open(downloaded, "wb") as f:
+                container.download_blob(blob_name).readinto(f)
+
+            sheets = _write_spool(downloaded, work, blob_name, chunksize)
+            os.remove(downloaded)
+
+            with open(os.path.join(work, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump({"blob": blob_name, "etag": etag, "sheets": sheets}, f)
+
+            try:
+                os.replace(work, final)
+            except OSError:
+                # Spooled concurrently by another request; theirs is identical
+                shutil.rmtree(work, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(work, ignore_errors=True)
+            raise
+
+        log.info(
+            "Spooled %s: %s sheets, %s rows in %.1fs",
+            blob_name, len(sheets), sum(s["rows"] for s in sheets),
+            time.perf_counter() - started,
+        )
+        _prune(root, key)
+
+    return [dict(sheet, dir=final) for sheet in sheets]
+
+
+def iter_sheet_chunks(sheet: dict):
+    """
+    Yields the spooled sheet as DataFrames, one per Parquet part. A sheet
+    with a header but no rows yields a single empty frame.
+    """
+    if not sheet["parts"]:
+        yield pd.DataFrame(columns=sheet["columns"])
+        return
+    for part in sheet["parts"]:
+        yield pq.read_table(os.path.join(sheet["dir"], part)).to_pandas()
+
+
+def open_sheet_stream(sheet: dict):
+    """
+    Same contract as blob_stream.open_table_stream:
+    (first_chunk, iterator over the remaining chunks).
+    """
+    chunks = iter_sheet_chunks(sheet)
+    return next(chunks), chunks
@@ -217,18 +217,40 @@
 from fastapi import FastAPI, HTTPException, Body
 from azure.storage.blob import BlobServiceClient
 import pandas as pd
-import requests
+import asyncio
+import itertools
 import os
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+
+from blob_stream import CSV_CHUNK_ROWS, open_table_stream
+from excel_reader import iter_sheet_chunks, open_sheet_stream, spool_workbook
+from push_checkpoint import PushCheckpoint
+from refresh_manifest import (
+    APPEND, MANIFEST_VERSION, TableRefresh, definition_key, load_manifest,
+    manifest_blob_name, mark_in_progress, previous_tables, reusable_dataset,
+    save_manifest,
+)
+from push_engine import PushEngine, PUSH_BATCH_SIZE, PUSH_MAX_BATCH_BYTES
+from row_serializer import iter_json_batches
+from schema_inference import infer_schema
+from token_provider import get_provider
+from powerbi_client import PowerBIClient, PowerBIError, close_http
+
+log = logging.getLogger("databinding")
 
 # --------------------------------------------------
 # LOAD ENV
 # --------------------------------------------------
 load_dotenv()
 
-POWERBI_API = "https://api.powerbi.com/v1.0/myorg"
-
 # Azure AD (STATIC – ENV)
 TENANT_ID = os.getenv("TENANT_ID")
 CLIENT_ID = os.getenv("CLIENT_ID")
@@ -245,10 +267,28 @@ AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 DATASET_NAME = "Migrated_Dataset"
 TABLE_NAME = "MainTable"
 
+# "single": every file concatenated into MainTable
+# "multi": one push table per file
+DEFAULT_MODE = "single"
+EXCEL_FILE_TYPES = (".xls", ".xlsx")
+TABLE_FILE_TYPES = (".csv", ".parquet") + EXCEL_FILE_TYPES
+# When one table is in the folder in several formats (e.g. /extract-data
+# run as CSV and again as Parquet), the first one here wins
+TABLE_FORMAT_PREFERENCE = (".parquet", ".csv", ".xlsx", ".xls")
+# Files downloaded and parsed concurrently in multi-table mode
+TABLE_LOAD_WORKERS = int(os.getenv("TABLE_LOAD_WORKERS", "4"))
+
 # --------------------------------------------------
 # APP
 # --------------------------------------------------
-app = FastAPI(title="Tableau to Power BI Migration")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Shared Power BI connection pool
+    await close_http()
+
+
+app = FastAPI(title="Tableau to Power BI Migration", lifespan=lifespan)
 # --------------------------------------------------
 # CORS (ALLOW ALL)
 # --------------------------------------------------
@@ -264,113 +304,241 @@ app.add_middleware(
 # AUTH TOKEN
 # --------------------------------------------------
 def get_token() -> str:
-    r = requests.post(
-        f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token",
-        data={
-            "grant_type": "client_credentials",
-            "client_id": CLIENT_ID,
-            "client_secret": CLIENT_SECRET,
-            "scope": "https://analysis.windows.net/powerbi/api/.default",
-        },
-        timeout=30,
-    )
-    r.raise_for_status()
-    return r.json()["access_token"]
+    # One MSAL app per process; token cached until shortly before expiry
+    return get_provider().get_token()
 
 # --------------------------------------------------
 # READ BLOB DATA
 # --------------------------------------------------
-def read_blob_data(container_name: str, folder_name: str) -> pd.DataFrame:
+def get_container(container_name: str):
     service = BlobServiceClient.from_connection_string(
         AZURE_STORAGE_CONNECTION_STRING
     )
-    container = service.get_container_client(container_name)
+    return service.get_container_client(container_name)
 
+
+def read_blob_data(container, blobs: list) -> pd.DataFrame:
+    # blobs as returned by list_table_blobs
     dfs = []
-    prefix = f"{folder_name}/"
 
-    for blob in container.list_blobs(name_starts_with=prefix):
-        blob_client = container.get_blob_client(blob.name)
-        stream = blob_client.download_blob()
+    for blob in blobs:
+        name = blob.name.lower()
+        if name.endswith(".csv"):
+            # Text until TableSchema.coerce, so codes keep leading zeros
+            dfs.append(pd.read_csv(container.download_blob(blob.name), dtype=str))
+        elif name.endswith(".parquet"):
+            # Parquet needs a seekable buffer for its footer
+            dfs.append(pd.read_parquet(BytesIO(container.download_blob(blob.name).readall())))
+        elif name.endswith(EXCEL_FILE_TYPES):
+            # Every sheet, parsed once per blob version and spooled to Parquet
+            for sheet in spool_workbook(container, blob.name, blob.etag):
+                dfs.extend(iter_sheet_chunks(sheet))
+
+    return pd.concat(dfs, ignore_index=True)
+
+# --------------------------------------------------
+# READ BLOB TABLES (MULTI-TABLE MODE)
+# --------------------------------------------------
+def table_name_for(base: str, taken: set) -> str:
+    # Reduced to a safe table name; names are compared case-insensitively
+    # like Power BI does
+    name = re.sub(r"[^0-9A-Za-z_]+", "_", base).strip("_") or "Table"
+
+    candidate, n = name, 2
+    while candidate.lower() in taken:
+        candidate = f"{name}_{n}"
+        n += 1
+    taken.add(candidate.lower())
+    return candidate
+
 
-        if blob.name.endswith(".csv"):
-            dfs.append(pd.read_csv(stream))
-        elif blob.name.endswith((".xls", ".xlsx")):
-            dfs.append(pd.read_excel(stream))
+def list_table_blobs(container, folder_name: str) -> list:
+    # One blob per table, so no table is read twice
+    picked = {}
+    for blob in container.list_blobs(name_starts_with=f"{folder_name}/"):
+        base, ext = os.path.splitext(blob.name)
+        ext = ext.lower()
+        if ext not in TABLE_FORMAT_PREFERENCE:
+            continue
 
-    if not dfs:
+        current = picked.get(base.lower())
+        if current is not None:
+            keep, skip = sorted(
+                (current, blob),
+                key=lambda b: TABLE_FORMAT_PREFERENCE.index(os.path.splitext(b.name)[1].lower()),
+            )
+            log.warning("%s is also in the folder as %s; skipping it", skip.name, keep.name)
+            blob = keep
+        picked[base.lower()] = blob
+
+    # Sorted so table order, and with it checkpoint batch indices, is stable
+    return sorted(picked.values(), key=lambda blob: blob.name)
+
+
+def open_blob_tables(container, blob) -> list:
+    """
+    [(sheet_name, first_chunk, remaining_chunks)] for one blob: a single
+    entry with sheet_name None for CSV/Parquet, one per sheet for Excel.
+    """
+    if blob.name.lower().endswith(EXCEL_FILE_TYPES):
+        return [
+            (sheet["name"], *open_sheet_stream(sheet))
+            for sheet in spool_workbook(container, blob.name, blob.etag)
+        ]
+    return [(None, *open_table_stream(container, blob.name, CSV_CHUNK_ROWS))]
+
+
+def read_blob_tables(container, blobs: list) -> list:
+    """
+    One table per file, or per sheet for workbooks with several sheets.
+    The first chunk of every file is downloaded and parsed in parallel
+    (enough to infer its schema); the remaining chunks are parsed lazily
+    while the table is pushed, so no file is held in memory whole and no
+    cross-file concat happens.
+    Returns [(table_name, first_chunk, remaining_chunks, reopen)] in blob
+    order; reopen() streams the table again from its first chunk.
+    """
+    with ThreadPoolExecutor(max_workers=TABLE_LOAD_WORKERS) as pool:
+        futures = [pool.submit(open_blob_tables, container, blob) for blob in blobs]
+
+        taken, tables = set(), []
+        for blob, future in zip(blobs, futures):
+            try:
+                opened = future.result()
+            except Exception as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Could not read {blob.name}: {e}",
+                )
+
+            base = os.path.splitext(os.path.basename(blob.name))[0]
+            for index, (sheet_name, first, rest) in enumerate(opened):
+                label = f"{base}_{sheet_name}" if len(opened) > 1 else base
+
+                def reopen(blob=blob, index=index):
+                    _, first, rest = open_blob_tables(container, blob)[index]
+                    return itertools.chain([first], rest)
+
+                tables.append((table_name_for(label, taken), first, rest, reopen))
+
+    return tables
+
+def load_sources(container_name: str, folder_name: str, mode: str):
+    """
+    Reads the folder and infers table schemas (blocking; run off the event
+    loop). Returns ([(schema, frames, reopen)], data_key) where data_key
+    identifies the input data for push checkpoints.
+    """
+    container = get_container(container_name)
+    blobs = list_table_blobs(container, folder_name)
+    if not blobs:
         raise HTTPException(status_code=404, detail="No files found in blob folder")
 
-    return pd.concat(dfs, ignore_index=True)
+    # Blob versions: an edited file gets a new ETag, so a checkpoint is
+    # never resumed onto different data
+    data_key = [(blob.name, blob.etag) for blob in blobs]
+
+    if mode == "multi":
+        # Chained so the first chunk is pushed before the rest is parsed
+        sources = [
+            (infer_schema(name, first), itertools.chain([first], rest), reopen)
+            for name, first, rest, reopen in read_blob_tables(container, blobs)
+        ]
+        return sources, data_key
+
+    df = read_blob_data(container, blobs)
+    sources = [(infer_schema(TABLE_NAME, df), [df], lambda: [df])]
+    return sources, data_key
+
+
+def plan_tables(refreshes: list, sources: list) -> list:
+    """
+    Per table: full push, append after the rows pushed last time, or
+    reload. Deciding reads the previously pushed rows, so it runs on a
+    pool. Returns the frames to push for each table.
+    """
+    def plan(refresh, source):
+        _, frames, reopen = source
+        return refresh.plan(frames, reopen)
+
+    with ThreadPoolExecutor(max_workers=TABLE_LOAD_WORKERS) as pool:
+        return list(pool.map(plan, refreshes, sources))
 
 # --------------------------------------------------
 # CREATE DATASET
 # --------------------------------------------------
-def create_dataset(token: str, target_workspace_id: str, df: pd.DataFrame) -> str:
-    payload = {
+async def create_dataset(client: PowerBIClient, target_workspace_id: str, schemas: list) -> str:
+    # Push datasets cannot gain tables later; every table is declared here
+    return await client.create_dataset(target_workspace_id, {
         "name": DATASET_NAME,
         "defaultMode": "Push",
-        "tables": [
-            {
-                "name": TABLE_NAME,
-                "columns": [
-                    {"name": col, "dataType": "string"} for col in df.columns
-                ],
-            }
-        ],
-    }
-
-    r = requests.post(
-        f"{POWERBI_API}/groups/{target_workspace_id}/datasets",
-        headers={"Authorization": f"Bearer {token}"},
-        json=payload,
-        timeout=30,
-    )
-    r.raise_for_status()
-    return r.json()["id"]
+        "tables": [schema.to_dataset_table() for schema in schemas],
+    })
 
 # --------------------------------------------------
 # PUSH ROWS
 # --------------------------------------------------
-def push_rows(
-    token: str, target_workspace_id: str, dataset_id: str, df: pd.DataFrame
-):
-    r = requests.post(
-        f"{POWERBI_API}/groups/{target_workspace_id}/datasets/{dataset_id}/tables/{TABLE_NAME}/rows",
-        headers={"Authorization": f"Bearer {token}"},
-        json={"rows": df.astype(str).to_dict(orient="records")},
-        timeout=30,
-    )
-    r.raise_for_status()
+def push_rows(engine: PushEngine, tables: list, checkpoint: PushCheckpoint) -> dict:
+    """
+    tables: [(TableSchema, iterable of DataFrames)], pushed in order.
+    Pushes the rows in batches of at most PUSH_BATCH_SIZE rows and
+    PUSH_MAX_BATCH_BYTES of JSON on a bounded worker pool; frames are
+    pulled one at a time, so each chunk is pushed as soon as it is parsed.
+    Acknowledged batches are recorded in the checkpoint and skipped when
+    resuming. Returns push stats per table.
+    """
+    # Batch positions in push order -> index in the full batch sequence
+    pending = []
+
+    def batches():
+        # Rows are coerced to the dataset's column types; each batch body is
+        # serialized straight from its DataFrame slice, missing values become null
+        index = 0
+        for schema, frames in tables:
+            for df in frames:
+                for batch in iter_json_batches(
+                    schema.name, df, PUSH_BATCH_SIZE,
+                    schema=schema, max_bytes=PUSH_MAX_BATCH_BYTES,
+                ):
+                    if index not in checkpoint.acked:
+                        pending.append(index)
+                        yield batch
+                    index += 1
+
+    def on_batch(position, table_name, row_count):
+        checkpoint.ack(pending[position])
+
+    stats = engine.push(batches(), on_batch=on_batch)
+    return {
+        schema.name: stats.get(
+            schema.name, {"rows": 0, "batches": 0, "seconds": 0, "rows_per_sec": 0}
+        )
+        for schema, _ in tables
+    }
 
 # --------------------------------------------------
 # CLONE REPORT
 # --------------------------------------------------
-def clone_report(
-    token: str, target_workspace_id: str, dataset_id: str, report_name: str
+async def clone_report(
+    client: PowerBIClient, target_workspace_id: str, dataset_id: str, report_name: str
 ) -> str:
-    r = requests.post(
-        f"{POWERBI_API}/groups/{TEMPLATE_WORKSPACE_ID}/reports/{TEMPLATE_REPORT_ID}/Clone",
-        headers={"Authorization": f"Bearer {token}"},
-        json={
-            "name": report_name,
-            "targetWorkspaceId": target_workspace_id,
-            "targetModelId": dataset_id,
-        },
-        timeout=30,
+    return await client.clone_report(
+        TEMPLATE_WORKSPACE_ID, TEMPLATE_REPORT_ID, report_name,
+        target_workspace_id, dataset_id,
     )
-    r.raise_for_status()
-    return r.json()["id"]
 
 # --------------------------------------------------
 # API ENDPOINT
 # --------------------------------------------------
 @app.post("/generate")
-def generate(payload: dict = Body(...)):
+async def generate(payload: dict = Body(...)):
     container_name = payload.get("container_name")
     folder_name = payload.get("folder_name")
     report_name = payload.get("report_name")
     target_workspace_id = payload.get("target_workspace_id")
+    mode = payload.get("mode", DEFAULT_MODE)
+    # Reuse the last run's dataset and push only appended rows
+    incremental = bool(payload.get("incremental", False))
 
     if not all(
         [container_name, folder_name, report_name, target_workspace_id]
@@ -380,24 +548,138 @@ def generate(payload: dict = Body(...)):
             detail="container_name, folder_name, report_name, target_workspace_id are required",
         )
 
-    token = get_token()
-    df = read_blob_data(container_name, folder_name)
+    if mode not in ("single", "multi"):
+        raise HTTPException(status_code=400, detail="mode must be 'single' or 'multi'")
+
+    client = PowerBIClient(get_token)
+    try:
+        return await run_generate(
+            client, container_name, folder_name, report_name,
+            target_workspace_id, mode, incremental,
+        )
+    except PowerBIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
 
-    dataset_id = create_dataset(token, target_workspace_id, df)
-    push_rows(token, target_workspace_id, dataset_id, df)
+async def run_generate(
+    client: PowerBIClient, container_name: str, folder_name: str,
+    report_name: str, target_workspace_id: str, mode: str, incremental: bool,
+) -> dict:
+    sources, data_key = await run_in_threadpool(
+        load_sources, container_name, folder_name, mode
+    )
 
-    report_id = clone_report(
-        token,
-        target_workspace_id,
-        dataset_id,
-        report_name,
+    schemas = [schema for schema, _, _ in sources]
+    manifest_name = manifest_blob_name(
+        "generate", container_name, folder_name, target_workspace_id, report_name, mode
+    )
+    definition = definition_key([schema.to_dataset_table() for schema in schemas])
+    manifest = (
+        await run_in_threadpool(load_manifest, manifest_name) if incremental else None
     )
+    # Entries the interrupted attempt planned against, if there was one
+    planned = previous_tables(manifest, definition, include_unfinished=True)
+
+    # Same inputs + same data -> resume the previous attempt's dataset
+    checkpoint = PushCheckpoint(
+        PushCheckpoint.key(container_name, folder_name, report_name, target_workspace_id, mode),
+        PushCheckpoint.key(
+            data_key, CSV_CHUNK_ROWS, PUSH_BATCH_SIZE, PUSH_MAX_BATCH_BYTES,
+            sorted((name, entry["digest"]) for name, entry in planned.items()),
+        ),
+    )
+    resumed = checkpoint.resumed
+    reuse_id = reusable_dataset(manifest, definition)
+
+    if resumed:
+        dataset_id = checkpoint.dataset_id
+    elif reuse_id and await client.get_dataset(target_workspace_id, reuse_id):
+        dataset_id = reuse_id
+        checkpoint.set_dataset(dataset_id)
+    else:
+        dataset_id = await create_dataset(client, target_workspace_id, schemas)
+        checkpoint.set_dataset(dataset_id)
+
+    reused = reuse_id is not None and dataset_id == reuse_id
+    # A resumed attempt keeps its plan, so its batch indices line up.
+    # Otherwise an unfinished push leaves no usable entries and every
+    # table is replaced.
+    if not reused:
+        previous = {}
+    elif resumed:
+        previous = planned
+    else:
+        previous = previous_tables(manifest, definition)
+
+    refreshes = [TableRefresh(schema, previous.get(schema.name)) for schema in schemas]
+    frames = await run_in_threadpool(plan_tables, refreshes, sources)
+    tables = list(zip(schemas, frames))
+
+    engine = PushEngine(target_workspace_id, dataset_id, get_token)
+    if not checkpoint.acked:
+        # Once a batch is acknowledged, tables were already cleared (or
+        # the dataset was ready) in the attempt being resumed
+        if reused:
+            # Until the new manifest is saved, the old one no longer
+            # describes the dataset's rows
+            await run_in_threadpool(mark_in_progress, manifest_name, manifest)
+            await asyncio.gather(*(
+                client.delete_rows(target_workspace_id, dataset_id, refresh.schema.name)
+                for refresh in refreshes
+                if refresh.mode != APPEND
+            ))
+        else:
+            await run_in_threadpool(engine.wait_until_ready)
+
+    started = time.perf_counter()
+    try:
+        # Thread-based pool and rate limiters; kept off the event loop
+        push_stats = await run_in_threadpool(push_rows, engine, tables, checkpoint)
+    except Exception as e:
+        raise HTTPException(
+            status_code=502,
+            detail=(
+                f"Push failed after {len(checkpoint.acked)} acknowledged batches "
+                f"({e}); call /generate again with the same inputs to resume"
+            ),
+        )
+    seconds = max(time.perf_counter() - started, 1e-6)
+    rows_pushed = sum(stats["rows"] for stats in push_stats.values())
+
+    for refresh in refreshes:
+        push_stats[refresh.schema.name]["refresh"] = refresh.mode
+        push_stats[refresh.schema.name]["skippedRows"] = refresh.skipped_rows
+
+    if reused and manifest.get("reportId"):
+        report_id = manifest["reportId"]
+    else:
+        report_id = await clone_report(
+            client,
+            target_workspace_id,
+            dataset_id,
+            report_name,
+        )
+    checkpoint.clear()
+
+    await run_in_threadpool(save_manifest, manifest_name, {
+        "version": MANIFEST_VERSION,
+        "datasetId": dataset_id,
+        "reportId": report_id,
+        "definition": definition,
+        "tables": {refresh.schema.name: refresh.entry() for refresh in refreshes},
+    })
 
     return {
         "datasetId": dataset_id,
         "reportId": report_id,
         "reportName": report_name,
         "targetWorkspaceId": target_workspace_id,
+        "mode": mode,
+        "tables": push_stats,
+        "rowsPushed": rows_pushed,
+        "rowsPerSec": round(rows_pushed / seconds, 1),
+        "resumed": resumed,
+        "datasetReused": reused,
     }
 
 # --------------------------------------------------
@@ -0,0 +1,37 @@
+import re
+
+# Power BI push dataset column types
+INT64 = "Int64"
+DOUBLE = "Double"
+BOOLEAN = "Boolean"
+DATETIME = "DateTime"
+STRING = "string"
+
+NUMERIC_TYPES = {INT64, DOUBLE}
+
+_HYPER_TYPES = {
+    "BOOL": BOOLEAN,
+    "SMALL_INT": INT64,
+    "INT": INT64,
+    "BIG_INT": INT64,
+    "OID": INT64,
+    "NUMERIC": DOUBLE,
+    "FLOAT": DOUBLE,
+    "DOUBLE": DOUBLE,
+    "DATE": DATETIME,
+    "TIMESTAMP": DATETIME,
+    "TIMESTAMP_TZ": DATETIME,
+}
+
+# customer_id, "Order ID", CustomerID, CustomerId -- but not "Paid"
+_KEY_NAME = re.compile(r"(?:^|[_\s.-])id$", re.IGNORECASE)
+_CAMEL_KEY_NAME = re.compile(r"[a-z0-9]I[dD]$")
+
+
+def hyper_type_to_pbi(sql_type) -> str:
+    tag = getattr(sql_type.tag, "name", str(sql_type.tag))
+    return _HYPER_TYPES.get(tag, STRING)
+
+
+def is_key_name(name: str) -> bool:
+    return bool(_KEY_NAME.search(name) or _CAMEL_KEY_NAME.search(name))
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+PUSH_CHECKPOINT_DIR = os.getenv(
+    "PUSH_CHECKPOINT_DIR",
+    os.path.join(tempfile.gettempdir(), "push-checkpoints")
+)
+
+# ============================================================
+# CHECKPOINT
+# ============================================================
+
+class PushCheckpoint:
+    """
+    Progress of one /generate call: the dataset it created and the batch
+    indices Power BI has acknowledged. The dataset is kept in a small JSON
+    file and acks are appended to a log next to it, one index per line, so
+    each ack costs one short write however long the push. A retried call
+    with the same inputs reuses the dataset and only pushes the missing
+    batches. A fingerprint of the data and batching settings guards
+    against resuming with different rows.
+    """
+
+    def __init__(self, key: str, fingerprint: str, root: str = PUSH_CHECKPOINT_DIR):
+        self.path = os.path.join(root, f"{key}.json")
+        self.log_path = os.path.join(root, f"{key}.acks")
+        self.fingerprint = fingerprint
+        self.dataset_id = None
+        self.acked = set()
+        self._lock = threading.Lock()
+        self._log = None
+
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key(*parts) -> str:
+        raw = "\x1f".join(str(p) for p in parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def resumed(self) -> bool:
+        return self.dataset_id is not None
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            # Acks without a dataset cannot be resumed
+            self.clear()
+            return
+
+        if state.get("fingerprint") != self.fingerprint:
+            # Different data or batching: batch indices no longer line up
+            self.clear()
+            return
+
+        self.dataset_id = state.get("datasetId")
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    # A line cut short by a crash was never acknowledged
+                    if line.endswith("\n"):
+                        self.acked.add(int(line))
+        except FileNotFoundError:
+            pass
+
+    def _save(self):
+        state = {
+            "fingerprint": self.fingerprint,
+            "datasetId": self.dataset_id,
+        }
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def set_dataset(self, dataset_id: str):
+        with self._lock:
+            self.dataset_id = dataset_id
+            self._save()
+
+    def ack(self, index: int):
+        with self._lock:
+            if self._log is None:
+                self._log = open(self.log_path, "a", encoding="utf-8")
+            self._log.write(f"{index}\n")
+            # Flushed, not fsynced: survives a worker crash, which is what
+            # resuming is for
+            self._log.flush()
+            self.acked.add(index)
+
+    def clear(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            for path in (self.path, self.log_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,225 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import pandas as pd
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, ContentSettings
+
+log = logging.getLogger("refresh-manifest")
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+# Dataset id and per-table row digests of the last successful push
+REFRESH_MANIFEST_CONTAINER = os.getenv("REFRESH_MANIFEST_CONTAINER", "refresh-manifests")
+MANIFEST_VERSION = 1
+
+# How a table was refreshed
+FULL = "full"        # new dataset (or no usable manifest): every row pushed
+APPEND = "append"    # previous rows unchanged: only the rows after them pushed
+RELOAD = "reload"    # previous rows changed: table cleared and re-pushed
+
+# ============================================================
+# ROW DIGEST
+# ============================================================
+
+class RowDigest:
+    """
+    Order-sensitive digest of a table's rows. Rows are hashed after schema
+    coercion, so the same values give the same digest however the source
+    file was chunked.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.rows = 0
+
+    def update(self, df: pd.DataFrame):
+        if len(df):
+            hashes = pd.util.hash_pandas_object(df, index=False)
+            self._hash.update(hashes.to_numpy().tobytes())
+        self.rows += len(df)
+
+    def hexdigest(self) -> str:
+        # hashlib digests do not finalize; updating afterwards is fine
+        return self._hash.hexdigest()
+
+
+def schema_signature(schema) -> list:
+    return [[c.name, c.data_type] for c in schema.columns]
+
+
+def definition_key(definition) -> str:
+    """
+    Hash of a dataset definition (tables, relationships). Push datasets
+    cannot change shape, so a different definition needs a new dataset.
+    """
+    raw = json.dumps(definition, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# ============================================================
+# TABLE REFRESH
+# ============================================================
+
+class TableRefresh:
+    """
+    Refresh of one table against its entry in the previous manifest.
+    plan() decides the mode and returns the frames to push; the digest of
+    every row of the table is tracked as those frames are consumed, for
+    the next manifest (entry()).
+    """
+
+    def __init__(self, schema, previous: dict = None):
+        self.schema = schema
+        self.previous = previous
+        self.digest = RowDigest()
+        self.mode = FULL
+        self.skipped_rows = 0
+
+    def plan(self, frames, reopen):
+        """
+        frames: the table's DataFrames from the start. The rows the previous
+        push covered are read (not pushed) and checked against its digest.
+        reopen: zero-arg callable returning the frames from the start again,
+        used when those rows changed and the table must be reloaded.
+        """
+        previous = self.previous
+        if previous is None or previous["columns"] != schema_signature(self.schema):
+            self.mode = FULL
+            return self._track(frames)
+
+        frames = iter(frames)
+        tail = []
+        while self.digest.rows < previous["rows"]:
+            df = next(frames, None)
+            if df is None:
+                break
+            df = self.schema.coerce(df)
+            need = previous["rows"] - self.digest.rows
+            self.digest.update(df.iloc[:need])
+            if len(df) > need:
+                tail.append(df.iloc[need:])
+
+        if (self.digest.rows == previous["rows"]
+                and self.digest.hexdigest() == previous["digest"]):
+            self.mode = APPEND
+            self.skipped_rows = previous["rows"]
+            return self._track(tail, frames)
+
+        log.info(
+            "%s: rows pushed last time changed; reloading the table",
+            self.schema.name,
+        )
+        self.mode = RELOAD
+        self.digest = RowDigest()
+        return self._track(reopen())
+
+    def _track(self, *sources):
+        for frames in sources:
+            for df in frames:
+                df = self.schema.coerce(df)
+                self.digest.update(df)
+                yield df
+
+    def entry(self) -> dict:
+        return {
+            "columns": schema_signature(self.schema),
+            "rows": self.digest.rows,
+            "digest": self.digest.hexdigest(),
+        }
+
+# ============================================================
+# MANIFEST STORE
+# ============================================================
+
+_manifest_container = None
+_manifest_container_lock = threading.Lock()
+
+
+def _get_manifest_container():
+    global _manifest_container
+    with _manifest_container_lock:
+        if _manifest_container is None:
+            service = BlobServiceClient.from_connection_string(
+                os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+            )
+            container = service.get_container_client(REFRESH_MANIFEST_CONTAINER)
+            try:
+                container.create_container()
+            except ResourceExistsError:
+                pass
+            _manifest_container = container
+        return _manifest_container
+
+
+def manifest_blob_name(*parts) -> str:
+    # e.g. migrate-static/<folder>/<workspace>.v1.json
+    path = "/".join(str(p).strip("/") for p in parts)
+    return f"{path}.v{MANIFEST_VERSION}.json"
+
+
+def load_manifest(blob_name: str):
+    try:
+        data = _get_manifest_container().download_blob(blob_name).readall()
+    except ResourceNotFoundError:
+        return None
+    return json.loads(data)
+
+
+def _upload_manifest(blob_name: str, manifest: dict):
+    _get_manifest_container().upload_blob(
+        blob_name,
+        json.dumps(manifest, separators=(",", ":")),
+        overwrite=True,
+        content_settings=ContentSettings(content_type="application/json"),
+    )
+
+
+def save_manifest(blob_name: str, manifest: dict):
+    """
+    Written only after every batch was acknowledged. A failure is logged,
+    not raised: the push itself succeeded, the next refresh is just full.
+    """
+    try:
+        _upload_manifest(blob_name, manifest)
+    except Exception:
+        log.exception("Could not save refresh manifest %s", blob_name)
+
+
+def mark_in_progress(blob_name: str, manifest: dict):
+    """
+    Flags the manifest before rows are cleared or pushed into the dataset
+    it describes; save_manifest replaces it once the push succeeded. A
+    run that fails in between may have landed part of its rows, so the
+    next run replaces every table instead of appending after rows it
+    cannot account for. Raises: pushing without the flag is unsafe.
+    """
+    _upload_manifest(blob_name, dict(manifest, inProgress=True))
+
+
+def reusable_dataset(manifest, definition: str):
+    """
+    Id of the dataset the manifest describes, when it has this
+    definition; None otherwise.
+    """
+    if not manifest or manifest.get("definition") != definition:
+        return None
+    return manifest.get("datasetId")
+
+
+def previous_tables(manifest, definition: str, include_unfinished: bool = False) -> dict:
+    """
+    Manifest table entries usable for an incremental refresh of a dataset
+    with this definition; empty when there is nothing to build on, or when
+    the last push did not finish. include_unfinished returns the entries
+    of an interrupted push too, for resuming it from a checkpoint.
+    """
+    if not reusable_dataset(manifest, definition):
+        return {}
+    if manifest.get("inProgress") and not include_unfinished:
+        return {}
+    return manifest.get("tables", {})
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from msal import ConfidentialClientApplication
+from token_provider import get_provider
 
 # 🔑 LOAD ENV HERE
 load_dotenv()
@@ -17,19 +17,8 @@ if not all([TENANT_ID, CLIENT_ID, CLIENT_SECRET]):
         f"CLIENT_SECRET={'SET' if CLIENT_SECRET else None}"
     )
 
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE = ["https://analysis.windows.net/powerbi/api/.default"]
 
 def get_access_token():
-    app = ConfidentialClientApplication(
-        client_id=CLIENT_ID,
-        client_credential=CLIENT_SECRET,
-        authority=AUTHORITY
-    )
-
-    result = app.acquire_token_for_client(scopes=SCOPE)
-
-    if "access_token" not in result:
-        raise Exception(f"Token acquisition failed: {result}")
-
-    return result["access_token"]
+    # One ConfidentialClientApplication per process; the token is reused
+    # until shortly before it expires
+    return get_provider().get_token()
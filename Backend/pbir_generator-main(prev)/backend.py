@@ -245,12 +245,13 @@
 
 import os
 import json
-import requests
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from msal import ConfidentialClientApplication
+from token_provider import get_provider
+from powerbi_client import PowerBIClient, PowerBIError, close_http
 
 # 1. IMPORT THE GENERATOR FUNCTIONS
 from blob_reader import read_metadata_from_blob, extract_worksheets
@@ -264,10 +265,15 @@ load_dotenv()
 TENANT_ID = os.getenv("TENANT_ID")
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE = ["https://analysis.windows.net/powerbi/api/.default"]
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Shared Power BI connection pool
+    await close_http()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -289,48 +295,32 @@ class RuntimeVisualsRequest(BaseModel):
 
 # KEPT EXISTING: Your original Service Principal token function
 def get_access_token() -> str:
-    app_auth = ConfidentialClientApplication(
-        CLIENT_ID,
-        authority=AUTHORITY,
-        client_credential=CLIENT_SECRET
-    )
-    token = app_auth.acquire_token_for_client(scopes=SCOPE)
-    return token["access_token"]
+    # Shared MSAL app; token cached and refreshed ahead of expiry
+    return get_provider().get_token()
 
 # CHANGED: We don't need OBO anymore! The token from the frontend is already valid for Power BI.
 @app.post("/embed-token")
-def generate_embed_token(data: EmbedRequest):
+async def generate_embed_token(data: EmbedRequest):
     try:
         # The userToken from sessionStorage IS your Power BI access token!
-        access_token = data.userToken 
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        token_url = f"https://api.powerbi.com/v1.0/myorg/groups/{data.workspaceId}/reports/{data.reportId}/GenerateToken"
-        payload = {
-            "accessLevel": "Edit",
-            "allowSaveAs": True,
-            "datasets": [{"id": data.datasetId}]
-        }
-        
+        client = PowerBIClient(data.userToken)
+
         # Send the request directly to Power BI using the user's token
-        token_res = requests.post(token_url, headers=headers, json=payload)
-        
-        if token_res.status_code != 200:
-            raise HTTPException(status_code=token_res.status_code, detail=token_res.text)
-            
-        token_json = token_res.json()
+        token_json = await client.generate_token(
+            data.workspaceId,
+            data.reportId,
+            [data.datasetId],
+            access_level="Edit",
+            allow_save_as=True,
+        )
         
         return {
             "embedToken": token_json["token"],
             "embedUrl": f"https://app.powerbi.com/reportEmbed?reportId={data.reportId}&groupId={data.workspaceId}",
             "datasetId": data.datasetId
         }
-    except HTTPException:
-        raise
+    except PowerBIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,286 @@
+import os
+import random
+import asyncio
+import logging
+
+import httpx
+
+log = logging.getLogger("powerbi-client")
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+POWERBI_API = "https://api.powerbi.com/v1.0/myorg"
+
+PBI_HTTP_TIMEOUT = float(os.getenv("PBI_HTTP_TIMEOUT", "30"))
+PBI_HTTP_CONNECT_TIMEOUT = float(os.getenv("PBI_HTTP_CONNECT_TIMEOUT", "10"))
+# Imports upload whole PBIX files
+PBI_HTTP_UPLOAD_TIMEOUT = float(os.getenv("PBI_HTTP_UPLOAD_TIMEOUT", "300"))
+PBI_HTTP_MAX_CONNECTIONS = int(os.getenv("PBI_HTTP_MAX_CONNECTIONS", "20"))
+PBI_HTTP_MAX_RETRIES = int(os.getenv("PBI_HTTP_MAX_RETRIES", "4"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Retried on server errors too; a POST is only retried when Power BI
+# throttled it (429) or it never reached the server
+IDEMPOTENT_METHODS = {"GET", "PUT", "DELETE", "HEAD"}
+
+# ============================================================
+# SHARED HTTP CLIENT
+# ============================================================
+
+_http = None
+
+
+def _http2_available() -> bool:
+    # HTTP/2 needs the h2 package (httpx[http2])
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_http() -> httpx.AsyncClient:
+    """
+    One pooled client per worker process. Created on first use inside the
+    event loop; close it from the app's lifespan with close_http().
+    """
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            http2=_http2_available(),
+            timeout=httpx.Timeout(PBI_HTTP_TIMEOUT, connect=PBI_HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=PBI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=PBI_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+    return _http
+
+
+async def close_http():
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+# ============================================================
+# ERRORS
+# ============================================================
+
+class PowerBIError(Exception):
+    """
+    Non-success answer from the REST API. detail is the parsed JSON body
+    when there is one, else the raw text, so endpoints can pass it on as
+    HTTPException(status_code=e.status_code, detail=e.detail).
+    """
+
+    def __init__(self, status_code: int, detail):
+        super().__init__(f"Power BI API error {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+    @classmethod
+    def from_response(cls, resp: httpx.Response):
+        try:
+            detail = resp.json()
+        except ValueError:
+            detail = resp.text
+        return cls(resp.status_code, detail)
+
+
+def _retry_delay(resp, attempt: int) -> float:
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    # Exponential backoff with jitter, capped at one minute
+    return min(60, 2 ** attempt) + random.uniform(0, 1)
+
+# ============================================================
+# CLIENT
+# ============================================================
+
+class PowerBIClient:
+    """
+    Async Power BI REST client over the shared pooled connection.
+
+    token: bearer string, or a zero-arg callable returning one. Callables
+    (e.g. TokenProvider.get_token, which may call MSAL) run in a worker
+    thread so a token refresh never blocks the event loop.
+    """
+
+    def __init__(self, token, http: httpx.AsyncClient = None,
+                 max_retries: int = PBI_HTTP_MAX_RETRIES):
+        self.token = token
+        self.http = http or get_http()
+        self.max_retries = max_retries
+
+    async def _auth(self) -> str:
+        token = self.token
+        if callable(token):
+            token = await asyncio.to_thread(token)
+        return f"Bearer {token}"
+
+    async def request(self, method: str, path: str, ok=(200, 201, 202),
+                      headers: dict = None, **kwargs) -> httpx.Response:
+        """
+        path is relative to POWERBI_API unless it is a full URL. Raises
+        PowerBIError for statuses outside `ok` once retries are used up.
+        """
+        url = path if path.startswith("https://") else f"{POWERBI_API}{path}"
+        method = method.upper()
+        retry_server_errors = method in IDEMPOTENT_METHODS
+
+        for attempt in range(self.max_retries + 1):
+            request_headers = {"Authorization": await self._auth(), **(headers or {})}
+            resp = None
+            try:
+                resp = await self.http.request(method, url, headers=request_headers, **kwargs)
+            except httpx.TransportError as e:
+                # A POST that may have reached the server is not repeated
+                sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if attempt == self.max_retries or (sent and not retry_server_errors):
+                    raise PowerBIError(502, f"{method} {url} failed: {e}") from e
+            else:
+                retryable = resp.status_code == 429 or (
+                    retry_server_errors and resp.status_code in RETRY_STATUS
+                )
+                if not retryable or attempt == self.max_retries:
+                    if resp.status_code not in ok:
+                        raise PowerBIError.from_response(resp)
+                    return resp
+
+            delay = _retry_delay(resp, attempt)
+            log.warning(
+                "%s %s retry %s/%s in %.1fs (status %s)",
+                method, url, attempt + 1, self.max_retries, delay,
+                resp.status_code if resp is not None else "network error",
+            )
+            await asyncio.sleep(delay)
+
+    # --------------------------------------------------------
+    # WORKSPACES
+    # --------------------------------------------------------
+
+    async def list_groups(self) -> list:
+        resp = await self.request("GET", "/groups")
+        return resp.json().get("value", [])
+
+    async def create_group(self, name: str) -> dict:
+        resp = await self.request("POST", "/groups?workspaceV2=true", json={"name": name})
+        return resp.json()
+
+    async def add_group_user(self, group_id: str, identifier: str,
+                             access_right: str = "Admin",
+                             principal_type: str = "App"):
+        await self.request(
+            "POST",
+            f"/groups/{group_id}/users",
+            ok=(200, 201, 204),
+            json={
+                "identifier": identifier,
+                "groupUserAccessRight": access_right,
+                "principalType": principal_type,
+            },
+        )
+
+    # --------------------------------------------------------
+    # REPORTS
+    # --------------------------------------------------------
+
+    async def list_reports(self, group_id: str) -> list:
+        resp = await self.request("GET", f"/groups/{group_id}/reports")
+        return resp.json().get("value", [])
+
+    async def clone_report(self, group_id: str, report_id: str, name: str,
+                           target_group_id: str, target_dataset_id: str) -> str:
+        resp = await self.request(
+            "POST",
+            f"/groups/{group_id}/reports/{report_id}/Clone",
+            json={
+                "name": name,
+                "targetWorkspaceId": target_group_id,
+                "targetModelId": target_dataset_id,
+            },
+        )
+        return resp.json()["id"]
+
+    async def generate_token(self, group_id: str, report_id: str,
+                             dataset_ids: list, access_level: str = "Edit",
+                             allow_save_as: bool = True) -> dict:
+        resp = await self.request(
+            "POST",
+            f"/groups/{group_id}/reports/{report_id}/GenerateToken",
+            ok=(200,),
+            json={
+                "accessLevel": access_level,
+                "allowSaveAs": allow_save_as,
+                "datasets": [{"id": d} for d in dataset_ids],
+            },
+        )
+        return resp.json()
+
+    async def import_pbix(self, group_id: str, file_name: str, content: bytes,
+                          dataset_display_name: str,
+                          name_conflict: str = "CreateOrOverwrite") -> dict:
+        resp = await self.request(
+            "POST",
+            f"/groups/{group_id}/imports",
+            params={
+                "datasetDisplayName": dataset_display_name,
+                "nameConflict": name_conflict,
+            },
+            files={"file": (file_name, content, "application/vnd.ms-powerbi.pbix")},
+            timeout=PBI_HTTP_UPLOAD_TIMEOUT,
+        )
+        return resp.json()
+
+    # --------------------------------------------------------
+    # DATASETS
+    # --------------------------------------------------------
+
+    async def list_datasets(self, group_id: str) -> list:
+        resp = await self.request("GET", f"/groups/{group_id}/datasets")
+        return resp.json().get("value", [])
+
+    async def get_dataset(self, group_id: str, dataset_id: str):
+        """
+        The dataset, or None when it no longer exists.
+        """
+        try:
+            resp = await self.request("GET", f"/groups/{group_id}/datasets/{dataset_id}")
+        except PowerBIError as e:
+            if e.status_code == 404:
+                return None
+            raise
+        return resp.json()
+
+    async def create_dataset(self, group_id: str, definition: dict) -> str:
+        resp = await self.request("POST", f"/groups/{group_id}/datasets", json=definition)
+        return resp.json()["id"]
+
+    async def push_rows(self, group_id: str, dataset_id: str, table_name: str,
+                        rows):
+        """
+        rows: list of dicts, or a pre-serialized {"rows": [...]} body as
+        produced by row_serializer. Bulk loads go through PushEngine, which
+        adds the per-dataset rate limits.
+        """
+        path = f"/groups/{group_id}/datasets/{dataset_id}/tables/{table_name}/rows"
+        if isinstance(rows, (bytes, bytearray)):
+            await self.request(
+                "POST", path, content=rows,
+                headers={"Content-Type": "application/json"},
+            )
+        else:
+            await self.request("POST", path, json={"rows": rows})
+
+    async def delete_rows(self, group_id: str, dataset_id: str, table_name: str):
+        await self.request(
+            "DELETE",
+            f"/groups/{group_id}/datasets/{dataset_id}/tables/{table_name}/rows",
+        )
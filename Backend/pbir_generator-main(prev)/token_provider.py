@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+import threading
+
+from msal import ConfidentialClientApplication
+
+log = logging.getLogger("token-provider")
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+POWERBI_SCOPE = ["https://analysis.windows.net/powerbi/api/.default"]
+
+# Refresh this many seconds before the token expires
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+# MSAL hands back its cached token until it is this close to expiry, so a
+# larger margin could never be met
+MSAL_REFRESH_WINDOW = 300
+# Shortest pause between background refresh attempts
+TOKEN_MIN_REFRESH_INTERVAL = 30
+
+# ============================================================
+# PROVIDER
+# ============================================================
+
+class TokenProvider:
+    """
+    Service-principal (client credentials) token source shared by the
+    whole process. One MSAL app is built once; the token is cached until
+    TOKEN_REFRESH_MARGIN seconds before expiry and refreshed ahead of time
+    by a background thread. get_token() is safe to call from any thread.
+    """
+
+    def __init__(self, tenant_id: str, client_id: str, client_secret: str,
+                 scopes: list = None, refresh_margin: int = TOKEN_REFRESH_MARGIN):
+        self.scopes = scopes or POWERBI_SCOPE
+        if refresh_margin > MSAL_REFRESH_WINDOW:
+            log.warning(
+                "TOKEN_REFRESH_MARGIN %s is above MSAL's %ss refresh window; using %s",
+                refresh_margin, MSAL_REFRESH_WINDOW, MSAL_REFRESH_WINDOW,
+            )
+            refresh_margin = MSAL_REFRESH_WINDOW
+        self.refresh_margin = refresh_margin
+
+        self._app = ConfidentialClientApplication(
+            client_id=client_id,
+            client_credential=client_secret,
+            authority=f"https://login.microsoftonline.com/{tenant_id}",
+        )
+
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def _fresh(self) -> bool:
+        return self._token is not None and \
+            time.time() < self._expires_at - self.refresh_margin
+
+    def _acquire(self):
+        result = self._app.acquire_token_for_client(scopes=self.scopes)
+
+        if "access_token" not in result:
+            raise Exception(f"Token acquisition failed: {result}")
+
+        self._token = result["access_token"]
+        self._expires_at = time.time() + int(result.get("expires_in", 3600))
+
+    def get_token(self) -> str:
+        if self._fresh():
+            return self._token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            if not self._fresh():
+                self._acquire()
+            self._start_refresher()
+            return self._token
+
+    def _start_refresher(self):
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, name="token-refresher", daemon=True
+        )
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        retry_delay = 5
+        while True:
+            # Never spin: if the token is still not fresh after a refresh,
+            # the next attempt waits at least the minimum interval
+            sleep_for = self._expires_at - self.refresh_margin - time.time()
+            time.sleep(max(sleep_for, TOKEN_MIN_REFRESH_INTERVAL))
+
+            try:
+                with self._lock:
+                    if not self._fresh():
+                        self._acquire()
+                retry_delay = 5
+            except Exception:
+                # Callers fall back to a synchronous refresh meanwhile
+                log.exception("Background token refresh failed")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 300)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> TokenProvider:
+    # Built from TENANT_ID / CLIENT_ID / CLIENT_SECRET on first use
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = TokenProvider(
+                os.getenv("TENANT_ID"),
+                os.getenv("CLIENT_ID"),
+                os.getenv("CLIENT_SECRET"),
+            )
+        return _provider
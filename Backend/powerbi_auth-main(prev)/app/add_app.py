@@ -1,11 +1,10 @@
 from fastapi import APIRouter, Request, HTTPException, Body
-import requests
-from app.config import POWERBI_API
+from app.powerbi_client import PowerBIClient, PowerBIError
 
 router = APIRouter()
 
 @router.post("/workspaces/{workspace_id}/add-app")
-def add_azure_app_to_workspace(
+async def add_azure_app_to_workspace(
     workspace_id: str,
     request: Request,
     payload: dict = Body(...)
@@ -24,23 +23,12 @@ def add_azure_app_to_workspace(
     if role not in ["Admin", "Member", "Contributor", "Viewer"]:
         raise HTTPException(status_code=400, detail="Invalid role")
 
-    url = f"{POWERBI_API}/groups/{workspace_id}/users"
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
-    body = {
-        "identifier": client_id,
-        "groupUserAccessRight": role,
-        "principalType": "App"
-    }
-
-    resp = requests.post(url, headers=headers, json=body)
-
-    if resp.status_code not in (200, 201):
-        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    try:
+        await PowerBIClient(access_token).add_group_user(
+            workspace_id, client_id, access_right=role, principal_type="App"
+        )
+    except PowerBIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
     return {
         "message": "Azure App added to workspace",
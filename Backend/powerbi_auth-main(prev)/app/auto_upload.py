@@ -1,14 +1,14 @@
 from fastapi import APIRouter, Request, HTTPException, Body
-import requests
-import time
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 
-from app.config import POWERBI_API
 from app.blob import download_empty_pbix
+from app.powerbi_client import PowerBIClient, PowerBIError
 
 router = APIRouter()
 
 @router.post("/workspaces/{workspace_id}/auto-upload")
-def auto_upload(
+async def auto_upload(
     workspace_id: str,
     request: Request,
     payload: dict = Body(...)
@@ -25,48 +25,40 @@ def auto_upload(
         raise HTTPException(status_code=400, detail="Report name missing")
 
     # 3. Download PBIX template
-    pbix_bytes = download_empty_pbix()
+    pbix_bytes = await run_in_threadpool(download_empty_pbix)
 
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-
-    files = {
-        "file": (f"{report_name}.pbix", pbix_bytes, "application/vnd.ms-powerbi.pbix")
-    }
+    client = PowerBIClient(access_token)
 
     # 4. Upload PBIX to Power BI workspace
-    upload_url = (
-        f"{POWERBI_API}/groups/{workspace_id}/imports"
-        f"?datasetDisplayName={report_name}"
-        "&nameConflict=CreateOrOverwrite"
-    )
-
-    resp = requests.post(upload_url, headers=headers, files=files)
-
-    if resp.status_code not in (200, 201, 202):
-        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    try:
+        await client.import_pbix(
+            workspace_id,
+            f"{report_name}.pbix",
+            pbix_bytes,
+            dataset_display_name=report_name,
+            name_conflict="CreateOrOverwrite",
+        )
+    except PowerBIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
     # 5. Try to fetch the report ID (Power BI is async, so we retry)
-    reports_url = f"{POWERBI_API}/groups/{workspace_id}/reports"
-
     report_id = None
 
     for _ in range(5):  # Retry for ~10 seconds total
-        reports_resp = requests.get(reports_url, headers=headers)
-
-        if reports_resp.ok:
-            reports = reports_resp.json().get("value", [])
+        try:
+            reports = await client.list_reports(workspace_id)
+        except PowerBIError:
+            reports = []
 
-            for r in reports:
-                if r["name"].lower() == report_name.lower():
-                    report_id = r["id"]
-                    break
+        for r in reports:
+            if r["name"].lower() == report_name.lower():
+                report_id = r["id"]
+                break
 
         if report_id:
             break
 
-        time.sleep(2)
+        await asyncio.sleep(2)
 
     # 6. Return response to frontend
     return {
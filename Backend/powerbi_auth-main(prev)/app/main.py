@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.middleware.cors import CORSMiddleware
@@ -5,10 +6,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.auth import router as auth_router
 from app.workspaces import router as workspace_router
 from app.auto_upload import router as auto_upload_router
+from app.powerbi_client import close_http
 # from app.powerbi_folder_migration import router as folder_router
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Shared Power BI connection pool
+    await close_http()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
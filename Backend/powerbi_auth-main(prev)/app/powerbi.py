@@ -1,35 +1,25 @@
 from fastapi import APIRouter, HTTPException
-import requests
-from app.config import POWERBI_API
+from fastapi.concurrency import run_in_threadpool
 from app.blob import download_empty_pbix
+from app.powerbi_client import PowerBIClient, PowerBIError
 
 router = APIRouter()
 
 @router.post("/workspaces/{workspace_id}/upload")
-def upload_report(workspace_id: str, access_token: str):
-
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
+async def upload_report(workspace_id: str, access_token: str):
 
     try:
-        pbix_bytes = download_empty_pbix()
+        pbix_bytes = await run_in_threadpool(download_empty_pbix)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Blob download failed: {str(e)}")
 
-    files = {
-        "file": ("empty.pbix", pbix_bytes, "application/vnd.ms-powerbi.pbix")
-    }
-
-    url = (
-        f"{POWERBI_API}/groups/{workspace_id}/imports"
-        "?datasetDisplayName=EmptyReport"
-        "&nameConflict=CreateOrOverwrite"
-    )
-
-    resp = requests.post(url, headers=headers, files=files)
-
-    if resp.status_code not in (200, 201, 202):
-        raise HTTPException(status_code=resp.status_code, detail=resp.text)
-
-    return resp.json()
+    try:
+        return await PowerBIClient(access_token).import_pbix(
+            workspace_id,
+            "empty.pbix",
+            pbix_bytes,
+            dataset_display_name="EmptyReport",
+            name_conflict="CreateOrOverwrite",
+        )
+    except PowerBIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
@@ -54,9 +54,9 @@
 #         "workspaces": workspaces
 #     }
 import os
-import requests
+import asyncio
 from fastapi import APIRouter, Request, HTTPException, Body
-from app.config import POWERBI_API
+from app.powerbi_client import PowerBIClient, PowerBIError
 
 router = APIRouter()
 
@@ -66,32 +66,40 @@ router = APIRouter()
 SP_OBJECT_ID = os.getenv("SP_OBJECT_ID", "36d789fd-926b-4106-93dc-e3928b36913e")
 GRAPH_API = os.getenv("GRAPH_API", "https://graph.microsoft.com/v1.0")
 
+
+async def _or_empty(call) -> list:
+    # A workspace whose reports/datasets cannot be read is still listed
+    try:
+        return await call
+    except PowerBIError:
+        return []
+
+
 @router.get("/workspaces")
-def get_workspaces(request: Request):
+async def get_workspaces(request: Request):
     access_token = request.session.get("access_token")
     if not access_token:
         raise HTTPException(status_code=401, detail="Not logged in")
 
-    headers = {"Authorization": f"Bearer {access_token}"}
+    client = PowerBIClient(access_token)
 
     # Fetch groups
-    ws_resp = requests.get(f"{POWERBI_API}/groups", headers=headers)
-    if ws_resp.status_code != 200:
-        raise HTTPException(status_code=ws_resp.status_code, detail=ws_resp.text)
-
-    workspaces = ws_resp.json().get("value", [])
-
-    # Enrich workspaces with reports and datasets
-    for ws in workspaces:
-        workspace_id = ws["id"]
-        
-        # Reports
-        r_resp = requests.get(f"{POWERBI_API}/groups/{workspace_id}/reports", headers=headers)
-        ws["reports"] = r_resp.json().get("value", []) if r_resp.status_code == 200 else []
-        
-        # Datasets
-        d_resp = requests.get(f"{POWERBI_API}/groups/{workspace_id}/datasets", headers=headers)
-        ws["datasets"] = d_resp.json().get("value", []) if d_resp.status_code == 200 else []
+    try:
+        workspaces = await client.list_groups()
+    except PowerBIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    # Enrich workspaces with reports and datasets, all workspaces at once
+    listings = await asyncio.gather(*(
+        asyncio.gather(
+            _or_empty(client.list_reports(ws["id"])),
+            _or_empty(client.list_datasets(ws["id"])),
+        )
+        for ws in workspaces
+    ))
+    for ws, (reports, datasets) in zip(workspaces, listings):
+        ws["reports"] = reports
+        ws["datasets"] = datasets
 
     return {
         "count": len(workspaces),
@@ -100,7 +108,7 @@ def get_workspaces(request: Request):
 
 
 @router.post("/workspaces")
-def create_workspace(request: Request, payload: dict = Body(...)):
+async def create_workspace(request: Request, payload: dict = Body(...)):
     access_token = request.session.get("access_token")
     if not access_token:
         raise HTTPException(status_code=401, detail="Not logged in")
@@ -109,22 +117,11 @@ def create_workspace(request: Request, payload: dict = Body(...)):
     if not workspace_name:
         raise HTTPException(status_code=400, detail="workspace_name is required")
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
-    response = requests.post(
-        f"{POWERBI_API}/groups?workspaceV2=true",
-        headers=headers,
-        json={"name": workspace_name},
-        timeout=30
-    )
-
-    if response.status_code not in (200, 201):
-        raise HTTPException(status_code=response.status_code, detail=response.text)
+    try:
+        data = await PowerBIClient(access_token).create_group(workspace_name)
+    except PowerBIError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-    data = response.json()
     return {
         "message": "Workspace created successfully",
         "workspaceId": data["id"],
@@ -133,7 +130,7 @@ def create_workspace(request: Request, payload: dict = Body(...)):
 
 
 @router.get("/user/me")
-def get_user_details(request: Request):
+async def get_user_details(request: Request):
     """
     Fetches the authenticated user's profile details from Microsoft Graph.
     """
@@ -141,35 +138,30 @@ def get_user_details(request: Request):
     if not access_token:
         raise HTTPException(status_code=401, detail="Not logged in")
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
     try:
-        resp = requests.get(f"{GRAPH_API}/me", headers=headers, timeout=10)
-        
-        if resp.status_code != 200:
-            # Common issue: Token doesn't have Graph scopes
-            error_info = resp.json() if resp.text else "No response body"
-            raise HTTPException(
-                status_code=resp.status_code, 
-                detail={"message": "Failed to fetch user info from Graph", "ms_error": error_info}
-            )
+        resp = await PowerBIClient(access_token).request(
+            "GET", f"{GRAPH_API}/me", ok=(200,)
+        )
+    except PowerBIError as e:
+        if e.status_code == 502:
+            raise HTTPException(status_code=500, detail=f"Request to Graph API failed: {e.detail}")
+        # Common issue: Token doesn't have Graph scopes
+        raise HTTPException(
+            status_code=e.status_code,
+            detail={"message": "Failed to fetch user info from Graph", "ms_error": e.detail or "No response body"}
+        )
 
-        user_data = resp.json()
-        return {
-            "displayName": user_data.get("displayName"),
-            "mail": user_data.get("mail") or user_data.get("userPrincipalName"),
-            "jobTitle": user_data.get("jobTitle"),
-            "id": user_data.get("id"),
-            "preferredLanguage": user_data.get("preferredLanguage")
-        }
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Request to Graph API failed: {str(e)}")
+    user_data = resp.json()
+    return {
+        "displayName": user_data.get("displayName"),
+        "mail": user_data.get("mail") or user_data.get("userPrincipalName"),
+        "jobTitle": user_data.get("jobTitle"),
+        "id": user_data.get("id"),
+        "preferredLanguage": user_data.get("preferredLanguage")
+    }
 
 @router.post("/workspaces/add-sp")
-def add_service_principal_to_workspace(request: Request, payload: dict = Body(...)):
+async def add_service_principal_to_workspace(request: Request, payload: dict = Body(...)):
     """
     Adds the Service Principal to the workspace.
     Requires the user to have 'Admin' rights on the target workspace.
@@ -183,47 +175,26 @@ def add_service_principal_to_workspace(request: Request, payload: dict = Body(..
     if not workspace_id:
         raise HTTPException(status_code=400, detail="workspace_id is required")
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
-    # API Endpoint for adding users/principals to a workspace
-    users_url = f"{POWERBI_API}/groups/{workspace_id}/users"
-    
-    # PAYLOAD: Ensure 'identifier' is the Object ID of the Service Principal
-    add_payload = {
-        "identifier": SP_OBJECT_ID,
-        "principalType": "App",
-        "groupUserAccessRight": "Admin"
-    }
-
-    # Execute request
-    resp = requests.post(users_url, headers=headers, json=add_payload)
-
-    # 200, 201 (Created), or 204 (No Content) are all successes for this API
-    if resp.status_code in (200, 201, 204):
-        return {"status": "success", "message": "Service Principal added to workspace"}
-    
-    # Detailed error handling
+    # 'identifier' must be the Object ID of the Service Principal
     try:
-        error_detail = resp.json()
-    except:
-        error_detail = resp.text
-
-    # Log specific reasons for 403
-    if resp.status_code == 403:
-        # Possible reasons: 
-        # 1. User calling the API isn't an Admin of the Workspace.
-        # 2. The SP_OBJECT_ID is actually a Client ID.
-        # 3. Tenant settings haven't propagated yet.
-        raise HTTPException(
-            status_code=403,
-            detail={
-                "error": "Forbidden",
-                "reason": "Ensure the current user is a Workspace Admin and SP_OBJECT_ID is correct.",
-                "ms_response": error_detail
-            }
+        await PowerBIClient(access_token).add_group_user(
+            workspace_id, SP_OBJECT_ID, access_right="Admin", principal_type="App"
         )
+    except PowerBIError as e:
+        # Log specific reasons for 403
+        if e.status_code == 403:
+            # Possible reasons: 
+            # 1. User calling the API isn't an Admin of the Workspace.
+            # 2. The SP_OBJECT_ID is actually a Client ID.
+            # 3. Tenant settings haven't propagated yet.
+            raise HTTPException(
+                status_code=403,
+                detail={
+                    "error": "Forbidden",
+                    "reason": "Ensure the current user is a Workspace Admin and SP_OBJECT_ID is correct.",
+                    "ms_response": e.detail
+                }
+            )
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-    raise HTTPException(status_code=resp.status_code, detail=error_detail)
+    return {"status": "success", "message": "Service Principal added to workspace"}
@@ -1,5 +1,13 @@
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceExistsError, ResourceNotFoundError, ResourceModifiedError,
+    HttpResponseError
+)
 from azure.storage.blob import BlobServiceClient
 
 # Load variables from .env
@@ -9,6 +17,13 @@ AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 INPUT_CONTAINER = os.getenv("INPUT_CONTAINER")
 OUTPUT_CONTAINER = os.getenv("OUTPUT_CONTAINER")
 
+# Files uploaded at once / blocks uploaded at once within one large file
+BLOB_UPLOAD_WORKERS = int(os.getenv("BLOB_UPLOAD_WORKERS", "8"))
+BLOB_BLOCK_CONCURRENCY = int(os.getenv("BLOB_BLOCK_CONCURRENCY", "4"))
+BLOB_DOWNLOAD_CONCURRENCY = int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "4"))
+# Downloads restarted when the workbook is overwritten mid-download
+BLOB_DOWNLOAD_ATTEMPTS = int(os.getenv("BLOB_DOWNLOAD_ATTEMPTS", "3"))
+
 if not AZURE_STORAGE_CONNECTION_STRING:
     raise ValueError("AZURE_STORAGE_CONNECTION_STRING not found in .env")
 
@@ -16,32 +31,156 @@ blob_service = BlobServiceClient.from_connection_string(
     AZURE_STORAGE_CONNECTION_STRING
 )
 
+_output_container_ready = False
+_output_container_lock = threading.Lock()
+
+
+def progress_logger(label: str, step: int = 10):
+    # Returns a progress_hook for the blob SDK that prints every `step` percent
+    last = {"pct": -step}
+
+    def hook(current: int, total):
+        if not total:
+            return
+        pct = int(current * 100 / total)
+        if pct >= last["pct"] + step or current >= total:
+            last["pct"] = pct
+            print(f"{label}: {pct}% ({current}/{total} bytes)")
 
-def download_twbx(blob_path: str, local_path: str):
+    return hook
+
+
+def get_twbx_properties(blob_path: str):
+    # HEAD request only: ETag for change detection, size for disk planning
     blob_client = blob_service.get_blob_client(
         container=INPUT_CONTAINER,
         blob=blob_path
     )
+    return blob_client.get_blob_properties()
 
-    with open(local_path, "wb") as f:
-        f.write(blob_client.download_blob().readall())
 
-    return local_path
+def get_twbx_etag(blob_path: str) -> str:
+    return get_twbx_properties(blob_path).etag.strip('"')
 
 
-def upload_csv(local_path: str, blob_path: str):
+def download_twbx(blob_path: str, local_path: str, etag: str = None,
+                  progress_hook=None) -> str:
+    """
+    Downloads exactly the blob version `etag` (unquoted, as from
+    get_twbx_etag) so outputs are never cached under another version's
+    key. If the workbook was overwritten since, the new version is
+    downloaded instead. Returns the ETag actually downloaded.
+    """
+    blob_client = blob_service.get_blob_client(
+        container=INPUT_CONTAINER,
+        blob=blob_path
+    )
+
+    for attempt in range(BLOB_DOWNLOAD_ATTEMPTS):
+        if etag is None:
+            etag = get_twbx_etag(blob_path)
+
+        try:
+            # Ranged chunks are fetched in parallel and written straight into the
+            # file, so only a few chunks are ever held in memory.
+            downloader = blob_client.download_blob(
+                max_concurrency=BLOB_DOWNLOAD_CONCURRENCY,
+                etag=f'"{etag}"',
+                match_condition=MatchConditions.IfNotModified,
+                progress_hook=progress_hook or progress_logger(f"Downloading {blob_path}")
+            )
+
+            with open(local_path, "wb") as f:
+                downloader.readinto(f)
+
+            return etag
+        except ResourceModifiedError:
+            if attempt == BLOB_DOWNLOAD_ATTEMPTS - 1:
+                raise
+            print(f"{blob_path} changed during download, downloading the new version")
+            etag = None
+
+
+def get_output_container():
+    # Create-or-check the output container once per process
+    global _output_container_ready
+
     container_client = blob_service.get_container_client(
         OUTPUT_CONTAINER
     )
 
-    try:
-        container_client.create_container()
-    except Exception:
-        pass
+    if not _output_container_ready:
+        with _output_container_lock:
+            if not _output_container_ready:
+                try:
+                    container_client.create_container()
+                except ResourceExistsError:
+                    pass
+                except HttpResponseError as e:
+                    # e.g. a SAS without create rights; uploads may still work
+                    print("Could not create output container:", e)
+                _output_container_ready = True
+
+    return container_client
+
 
-    blob_client = container_client.get_blob_client(blob_path)
+def upload_file(local_path: str, blob_path: str, metadata: dict = None) -> dict:
+    blob_client = get_output_container().get_blob_client(blob_path)
+    started = time.perf_counter()
 
     with open(local_path, "rb") as f:
-        blob_client.upload_blob(f, overwrite=True)
+        # Large files are split into blocks uploaded in parallel
+        blob_client.upload_blob(
+            f,
+            overwrite=True,
+            max_concurrency=BLOB_BLOCK_CONCURRENCY,
+            metadata=metadata
+        )
+
+    return {
+        "file": os.path.basename(local_path),
+        "blob": blob_path,
+        "url": blob_client.url,
+        "bytes": os.path.getsize(local_path),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def upload_files(files: list, workers: int = BLOB_UPLOAD_WORKERS,
+                 metadata: dict = None) -> list:
+    """
+    files: list of (local_path, blob_path) tuples.
+    Uploads them concurrently and returns one result per file, in order.
+    """
+    if not files:
+        return []
+
+    get_output_container()
 
-    return blob_client.url
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(files)))) as pool:
+        return list(pool.map(lambda item: upload_file(*item, metadata), files))
+
+
+def outputs_match(blob_paths: list, source_etag: str) -> bool:
+    """
+    True when every output blob exists and was produced from the TWBX
+    version identified by source_etag (stored as blob metadata on upload).
+    """
+    if not blob_paths:
+        return False
+
+    container_client = get_output_container()
+
+    for blob_path in blob_paths:
+        try:
+            props = container_client.get_blob_client(blob_path).get_blob_properties()
+        except ResourceNotFoundError:
+            return False
+        if props.metadata.get("source_etag") != source_etag:
+            return False
+
+    return True
+
+
+def upload_csv(local_path: str, blob_path: str):
+    return upload_file(local_path, blob_path)["url"]
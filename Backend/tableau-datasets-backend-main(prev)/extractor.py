@@ -8,11 +8,19 @@
 
 
 from twbx_handler import extract_hyper_from_twbx
-from hyper_reader import extract_hyper_to_csv
+from hyper_reader import extract_hyper_to_csv, EXPORT_WORKERS
 
 
-def extract_from_twbx(twbx_path: str, output_dir: str, workbook_name: str):
+def extract_from_twbx(twbx_path: str, output_dir: str, workbook_name: str,
+                      output_format: str = "csv",
+                      workers: int = EXPORT_WORKERS,
+                      on_table=None):
     hyper_path = extract_hyper_from_twbx(twbx_path, output_dir)
 
     # Extract exists → proceed normally
-    return extract_hyper_to_csv(hyper_path, output_dir, workbook_name)
+    return extract_hyper_to_csv(
+        hyper_path, output_dir, workbook_name,
+        output_format=output_format,
+        workers=workers,
+        on_table=on_table
+    )
@@ -0,0 +1,25 @@
+# ============================================================
+# GUNICORN
+# ============================================================
+# Read by gunicorn from the working directory on startup.
+#
+# Extraction jobs (queue, status, scratch reservations, the Hyper
+# process) live in the memory of the process that accepted the POST, so
+# GET /jobs/{job_id} only finds jobs of its own worker. The service runs
+# exactly one worker; EXTRACT_JOB_WORKERS threads inside it run the jobs.
+
+wsgi_app = "main:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = 1
+# Long extractions run on job threads, requests return right away
+timeout = 120
+
+
+def on_starting(server):
+    # -w / WEB_CONCURRENCY would split the job state across processes
+    if server.num_workers != 1:
+        server.log.warning(
+            "Job state is per process; running 1 worker instead of %s",
+            server.num_workers,
+        )
+        server.num_workers = 1
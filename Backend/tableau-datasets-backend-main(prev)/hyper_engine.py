@@ -0,0 +1,169 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from tableauhyperapi import HyperProcess, Connection, Telemetry, HyperException
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+HYPER_MAX_CONNECTIONS = int(os.getenv("HYPER_MAX_CONNECTIONS", "8"))
+HYPER_CONNECT_TIMEOUT = float(os.getenv("HYPER_CONNECT_TIMEOUT", "300"))
+
+# ============================================================
+# ENGINE
+# ============================================================
+
+class HyperEngine:
+    """
+    Keeps one hyperd process alive for the whole worker and hands out
+    connections to it. The process is started lazily (or at app startup),
+    restarted if it dies, and the number of open connections is capped.
+    """
+
+    def __init__(self, telemetry=Telemetry.SEND_USAGE_DATA_TO_TABLEAU,
+                 max_connections: int = HYPER_MAX_CONNECTIONS,
+                 connect_timeout: float = HYPER_CONNECT_TIMEOUT):
+        self.telemetry = telemetry
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+
+        self._hyper = None
+        # Guards the process; held across a restart so no connection is
+        # checked out while it is swapped
+        self._lock = threading.Lock()
+        # Guards _active; notified whenever a connection is returned
+        self._count_lock = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._active = 0
+        self._restarts = 0
+
+    # -------- lifecycle --------
+
+    def _ensure_started(self):
+        # Caller holds _lock
+        if self._hyper is None or not self._hyper.is_open:
+            self._hyper = HyperProcess(telemetry=self.telemetry)
+        return self._hyper
+
+    def start(self):
+        with self._lock:
+            return self._ensure_started()
+
+    def stop(self):
+        with self._lock:
+            if self._hyper is not None:
+                try:
+                    self._hyper.shutdown()
+                except HyperException:
+                    pass
+                self._hyper = None
+
+    def restart(self, failed=None):
+        """
+        Replaces the Hyper process once every connection checked out from
+        it has been returned; new check-outs wait meanwhile. failed is the
+        process the caller saw fail: if another thread already replaced
+        it, the running one is returned instead of restarting again.
+        """
+        with self._lock:
+            if failed is not None and self._hyper is not failed \
+                    and self._hyper is not None and self._hyper.is_open:
+                return self._hyper
+
+            with self._count_lock:
+                if not self._count_lock.wait_for(
+                    lambda: self._active == 0, timeout=self.connect_timeout
+                ):
+                    raise RuntimeError(
+                        f"Timed out waiting for {self._active} Hyper "
+                        f"connections to close before restarting"
+                    )
+
+            if self._hyper is not None:
+                try:
+                    self._hyper.close()
+                except HyperException:
+                    pass
+            self._hyper = HyperProcess(telemetry=self.telemetry)
+            self._restarts += 1
+            print("Hyper process restarted")
+            return self._hyper
+
+    # -------- health --------
+
+    def is_healthy(self) -> bool:
+        hyper = self._hyper
+        if hyper is None or not hyper.is_open:
+            return False
+
+        try:
+            with Connection(endpoint=hyper.endpoint) as conn:
+                conn.execute_scalar_query("SELECT 1")
+            return True
+        except HyperException:
+            return False
+
+    def status(self) -> dict:
+        return {
+            "running": self._hyper is not None and self._hyper.is_open,
+            "active_connections": self._active,
+            "max_connections": self.max_connections,
+            "restarts": self._restarts,
+        }
+
+    # -------- connections --------
+
+    def _checkout(self):
+        # Counted under _lock so a restart sees every connection in use
+        with self._lock:
+            hyper = self._ensure_started()
+            with self._count_lock:
+                self._active += 1
+            return hyper
+
+    def _checkin(self):
+        with self._count_lock:
+            self._active -= 1
+            self._count_lock.notify_all()
+
+    def _open(self, database: str):
+        # Returns a connection counted in _active; the caller checks it in
+        hyper = self._checkout()
+        try:
+            return Connection(endpoint=hyper.endpoint, database=database)
+        except HyperException:
+            self._checkin()
+            # The process may have crashed underneath us; restart once
+            if self.is_healthy():
+                raise
+            self.restart(failed=hyper)
+
+        hyper = self._checkout()
+        try:
+            return Connection(endpoint=hyper.endpoint, database=database)
+        except HyperException:
+            self._checkin()
+            raise
+
+    @contextmanager
+    def connect(self, database: str):
+        if not self._slots.acquire(timeout=self.connect_timeout):
+            raise RuntimeError(
+                f"Timed out waiting for a Hyper connection "
+                f"({self.max_connections} in use)"
+            )
+
+        try:
+            conn = self._open(database)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                self._checkin()
+        finally:
+            self._slots.release()
+
+
+engine = HyperEngine()
@@ -61,9 +61,22 @@
 
 
 
-from tableauhyperapi import HyperProcess, Connection, Telemetry
 import pandas as pd
+import csv
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hyper_engine import engine
+from parquet_writer import stream_query_to_parquet
+
+# Rows buffered in memory before being flushed to the CSV file
+EXPORT_CHUNK_SIZE = int(os.getenv("HYPER_EXPORT_CHUNK_SIZE", "50000"))
+
+# Tables exported concurrently, each on its own Hyper connection
+EXPORT_WORKERS = int(os.getenv("HYPER_EXPORT_WORKERS", "4"))
+
+OUTPUT_FORMATS = ("csv", "parquet")
 
 def clean_table_name(name: str) -> str:
     # customers.csv_8DD21EEE... → customers
@@ -73,53 +86,134 @@ def clean_table_name(name: str) -> str:
 def normalize(name: str) -> str:
     return name.strip('"')
 
-def extract_hyper_to_csv(hyper_path: str, output_dir: str, workbook_name: str):
+def stream_query_to_csv(conn, query: str, columns: list, csv_path: str,
+                        chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    # Reads the Hyper result cursor in fixed-size chunks and appends them
+    # to the CSV, so memory use does not grow with the table size.
+    rows_written = 0
+
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(columns)
+
+        with conn.execute_query(query) as result:
+            chunk = []
+            for row in result:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    writer.writerows(chunk)
+                    rows_written += len(chunk)
+                    chunk.clear()
+
+            if chunk:
+                writer.writerows(chunk)
+                rows_written += len(chunk)
+
+    return rows_written
+
+def export_table(hyper_path: str, table, output_dir: str,
+                 streaming: bool = True,
+                 chunk_size: int = EXPORT_CHUNK_SIZE,
+                 output_format: str = "csv"):
+    # Exports one table on its own connection so several tables of the
+    # same .hyper file can be read at once.
+    schema_name = normalize(str(table.schema_name.name))
+    raw_name = normalize(str(table.name))
+    table_name = clean_table_name(raw_name)
+
+    table_info = {
+        "schema": schema_name,
+        "table": table_name,
+        "exported": False
+    }
+    out_path = None
+    started = time.perf_counter()
+
+    try:
+        with engine.connect(hyper_path) as conn:
+            table_def = conn.catalog.get_table_definition(table)
+            columns = [normalize(str(c.name)) for c in table_def.columns]
+
+            query = f'SELECT * FROM "{schema_name}"."{raw_name}"'
+
+            out_name = f"{schema_name}_{table_name}.{output_format}"
+            out_path = os.path.join(output_dir, out_name)
+
+            if output_format == "parquet":
+                row_count = stream_query_to_parquet(
+                    conn, query, columns, table_def, out_path, chunk_size
+                )
+            elif streaming:
+                row_count = stream_query_to_csv(
+                    conn, query, columns, out_path, chunk_size
+                )
+            else:
+                rows = conn.execute_list_query(query)
+
+                df = pd.DataFrame(rows, columns=columns)
+                df.to_csv(out_path, index=False)
+                row_count = len(df)
+
+        table_info["exported"] = True
+        table_info["format"] = output_format
+        table_info["rows"] = row_count
+        table_info["bytes"] = os.path.getsize(out_path)
+
+    except Exception as e:
+        table_info["error"] = str(e)
+        out_path = None
+
+    table_info["seconds"] = round(time.perf_counter() - started, 3)
+    return table_info, out_path
+
+def extract_hyper_to_csv(hyper_path: str, output_dir: str, workbook_name: str,
+                         streaming: bool = True,
+                         chunk_size: int = EXPORT_CHUNK_SIZE,
+                         output_format: str = "csv",
+                         workers: int = EXPORT_WORKERS,
+                         on_table=None):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
     csv_files = []
+    output_files = []
     tables = []
 
-    with HyperProcess(
-        telemetry=Telemetry.SEND_USAGE_DATA_TO_TABLEAU
-    ) as hyper:
-
-        with Connection(endpoint=hyper.endpoint, database=hyper_path) as conn:
-
-            for schema in conn.catalog.get_schema_names():
-                schema_name = normalize(str(schema))
-
-                for table in conn.catalog.get_table_names(schema):
-                    raw_name = normalize(str(table.name))
-                    table_name = clean_table_name(raw_name)
-
-                    table_info = {
-                        "schema": schema_name,
-                        "table": table_name,
-                        "exported": False
-                    }
-
-                    try:
-                        table_def = conn.catalog.get_table_definition(table)
-                        columns = [normalize(str(c.name)) for c in table_def.columns]
-
-                        rows = conn.execute_list_query(
-                            f'SELECT * FROM "{schema_name}"."{raw_name}"'
-                        )
-
-                        df = pd.DataFrame(rows, columns=columns)
-
-                        csv_name = f"{schema_name}_{table_name}.csv"
-                        csv_path = os.path.join(output_dir, csv_name)
-
-                        df.to_csv(csv_path, index=False)
-                        csv_files.append(csv_path)
-
-                        table_info["exported"] = True
-
-                    except Exception as e:
-                        table_info["error"] = str(e)
-
-                    tables.append(table_info)
+    with engine.connect(hyper_path) as conn:
+        hyper_tables = [
+            table
+            for schema in conn.catalog.get_schema_names()
+            for table in conn.catalog.get_table_names(schema)
+        ]
+
+    def export(table):
+        table_info, out_path = export_table(
+            hyper_path, table, output_dir, streaming, chunk_size, output_format
+        )
+        # Lets callers (e.g. the job queue) report per-table progress
+        if on_table is not None:
+            on_table(table_info)
+        return table_info, out_path
+
+    # Never ask for more connections than the shared engine hands out
+    workers = max(1, min(workers, engine.max_connections, len(hyper_tables) or 1))
+
+    if workers == 1:
+        results = [export(table) for table in hyper_tables]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(export, hyper_tables))
+
+    for table_info, out_path in results:
+        if out_path:
+            if output_format == "csv":
+                csv_files.append(out_path)
+            output_files.append(out_path)
+
+        tables.append(table_info)
 
     return {
         "csv_files": csv_files,
+        "output_files": output_files,
         "tables": tables
     }
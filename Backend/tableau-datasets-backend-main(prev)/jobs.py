@@ -0,0 +1,197 @@
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+EXTRACT_JOB_WORKERS = int(os.getenv("EXTRACT_JOB_WORKERS", "2"))
+EXTRACT_QUEUE_SIZE = int(os.getenv("EXTRACT_QUEUE_SIZE", "20"))
+# Finished jobs kept around for GET /jobs/{job_id}
+EXTRACT_JOB_HISTORY = int(os.getenv("EXTRACT_JOB_HISTORY", "500"))
+
+
+class QueueFullError(Exception):
+    pass
+
+# ============================================================
+# JOB
+# ============================================================
+
+class Job:
+    def __init__(self, job_id: str, fn, args: tuple):
+        self.job_id = job_id
+        self.fn = fn
+        self.args = args
+
+        self.status = "queued"
+        self.stage = "queued"
+        self.tables = []
+        self.result = None
+        self.error = None
+
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage: str):
+        print(f"[{self.job_id}] stage: {stage}")
+        with self._lock:
+            self.stage = stage
+
+    def table_done(self, table_info: dict):
+        with self._lock:
+            self.tables.append(table_info)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            data = {
+                "job_id": self.job_id,
+                "status": self.status,
+                "stage": self.stage,
+                "tables_done": len(self.tables),
+                "tables": list(self.tables),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if self.result is not None:
+                data["result"] = self.result
+            if self.error is not None:
+                data["error"] = self.error
+            return data
+
+# ============================================================
+# MANAGER
+# ============================================================
+
+class JobManager:
+    """
+    Bounded queue + fixed worker pool. submit() fails fast with
+    QueueFullError instead of piling up work when the service is busy.
+    Jobs are held in this process only, so the service runs a single
+    gunicorn worker (see gunicorn.conf.py).
+    """
+
+    def __init__(self, workers: int = EXTRACT_JOB_WORKERS,
+                 max_queue: int = EXTRACT_QUEUE_SIZE,
+                 history: int = EXTRACT_JOB_HISTORY):
+        self.workers = workers
+        self.history = history
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._worker, name=f"extract-worker-{i}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5):
+        # Never blocks: jobs still queued are failed to make room for the
+        # stop sentinels, and workers also exit on the event after their
+        # current job
+        self._stopping.set()
+
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.error = "Service shutting down"
+                job.status = "failed"
+                job.finished_at = time.time()
+            self._queue.task_done()
+
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit(self, job_id: str, fn, *args) -> Job:
+        # fn is called as fn(job, *args)
+        job = Job(job_id, fn, args)
+
+        if self._stopping.is_set():
+            raise QueueFullError("Extraction service is shutting down")
+
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError("Extraction queue is full, retry later")
+
+        with self._lock:
+            self._jobs[job_id] = job
+            self._trim()
+
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.status == "running")
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "running": running,
+        }
+
+    def _trim(self):
+        # Drop the oldest finished jobs once history is exceeded
+        excess = len(self._jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in ("succeeded", "failed"):
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+
+            job.status = "running"
+            job.started_at = time.time()
+
+            try:
+                job.result = job.fn(job, *job.args)
+                job.status = "succeeded"
+                job.stage = "done"
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+
+manager = JobManager()
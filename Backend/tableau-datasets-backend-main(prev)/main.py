@@ -1,13 +1,32 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-import uuid, tempfile, os
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+import uuid, os
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Response
+from contextlib import asynccontextmanager
+from typing import Literal
 
-from azure_blob import download_twbx, upload_csv
+from azure_blob import download_twbx, upload_files, get_twbx_properties, outputs_match
 from extractor import extract_from_twbx
+from hyper_reader import EXPORT_WORKERS
+from hyper_engine import engine
+from jobs import Job, QueueFullError, manager
+from result_cache import cache
+from scratch import scratch, SCRATCH_EXPANSION_FACTOR
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start hyperd once per worker and share it across requests
+    engine.start()
+    scratch.cleanup_stale()
+    manager.start()
+    yield
+    manager.stop()
+    engine.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,7 +41,12 @@ app.add_middleware(
 
 @app.get("/")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "hyper": engine.status(),
+        "jobs": manager.stats(),
+        "scratch": scratch.metrics(),
+    }
 
 @app.options("/{path:path}")
 def options_handler(path: str):
@@ -30,6 +54,9 @@ def options_handler(path: str):
 
 class ExtractRequest(BaseModel):
     blob_path: str  # path inside tableau-raw container
+    output_format: Literal["csv", "parquet"] = "csv"
+    workers: int = Field(default=EXPORT_WORKERS, ge=1)  # tables exported in parallel
+    skip_unchanged: bool = False  # skip the job when output blobs already match this TWBX
 
 # @app.post("/extract-data")
 # def extract_data(req: ExtractRequest):
@@ -68,63 +95,122 @@ class ExtractRequest(BaseModel):
 #         "tables": result["tables"]
 #     }
 
-@app.post("/extract-data")
-def extract_data(req: ExtractRequest):
-    import traceback
+def run_extraction(job: Job, req: ExtractRequest):
+    job_id = job.job_id
+    print("Job ID:", job_id)
 
-    print("===== /extract-data called =====")
-    print("Request body:", req)
+    print("Blob path received:", req.blob_path)
 
-    try:
-        print("Generating job ID")
-        job_id = str(uuid.uuid4())
-        print("Job ID:", job_id)
-
-        print("Creating temp directory")
-        work_dir = tempfile.mkdtemp()
-        print("Work dir:", work_dir)
+    workbook_name = os.path.splitext(
+        os.path.basename(req.blob_path)
+    )[0]
+    print("Workbook name:", workbook_name)
 
-        print("Blob path received:", req.blob_path)
+    # Same blob version + same format -> same output
+    props = get_twbx_properties(req.blob_path)
+    etag = props.etag.strip('"')
+    cache_key = cache.key(req.blob_path, etag, req.output_format)
+    cached = cache.get(cache_key)
 
-        workbook_name = os.path.splitext(
-            os.path.basename(req.blob_path)
-        )[0]
-        print("Workbook name:", workbook_name)
+    if cached and req.skip_unchanged:
+        data, _ = cached
+        if outputs_match([u["blob"] for u in data["uploads"]], etag):
+            print("Outputs already up to date, skipping")
+            return {**data, "job_id": job_id, "cached": True, "skipped": True}
 
-        local_twbx = os.path.join(work_dir, "input.twbx")
-        print("Local TWBX path:", local_twbx)
+    # Cache hits upload straight from the cache and need no scratch space
+    reserve = 0 if cached else int(props.size * SCRATCH_EXPANSION_FACTOR)
 
-        print("Calling download_twbx()")
-        download_twbx(req.blob_path, local_twbx)
-        print("Download completed")
+    job.set_stage("waiting_for_disk")
+    with scratch.workspace(job_id, reserve_bytes=reserve) as work_dir:
+        print("Work dir:", work_dir)
 
-        print("Calling extract_from_twbx()")
-        result = extract_from_twbx(
-            local_twbx,
-            work_dir,
-            workbook_name
+        if cached:
+            print("Cache hit:", cache_key)
+            data, output_files = cached
+            result = {"output_files": output_files, "tables": data["tables"]}
+            for table_info in data["tables"]:
+                job.table_done(table_info)
+        else:
+            local_twbx = os.path.join(work_dir, "input.twbx")
+            print("Local TWBX path:", local_twbx)
+
+            job.set_stage("downloading")
+            downloaded = download_twbx(req.blob_path, local_twbx, etag)
+            print("Download completed")
+
+            if downloaded != etag:
+                # Overwritten since the properties were read: outputs
+                # belong to the version actually downloaded
+                etag = downloaded
+                cache_key = cache.key(req.blob_path, etag, req.output_format)
+
+            job.set_stage("extracting")
+            result = extract_from_twbx(
+                local_twbx,
+                work_dir,
+                workbook_name,
+                output_format=req.output_format,
+                workers=req.workers,
+                on_table=job.table_done
+            )
+            print("Extraction completed")
+
+        print("Output files:", result.get("output_files"))
+
+        job.set_stage("uploading")
+        uploads = upload_files(
+            [
+                (path, f"{workbook_name}/{os.path.basename(path)}")
+                for path in result.get("output_files", [])
+            ],
+            metadata={"source_etag": etag}
         )
-        print("Extraction completed")
-
-        print("CSV files:", result.get("csv_files"))
-
-        uploaded = []
-        for csv in result.get("csv_files", []):
-            print("Uploading CSV:", csv)
-            blob_name = f"{workbook_name}/{os.path.basename(csv)}"
-            uploaded.append(upload_csv(csv, blob_name))
+        uploaded = [u["url"] for u in uploads]
 
         print("Upload completed")
 
-        return {
+        response = {
             "job_id": job_id,
             "workbook": workbook_name,
+            "output_format": req.output_format,
             "output_files": uploaded,
+            "uploads": uploads,
             "tables": result.get("tables"),
+            "cached": cached is not None,
         }
 
-    except Exception as e:
-        print("❌ ERROR OCCURRED")
-        traceback.print_exc()
-        return {"error": str(e)}
+        # Must run before the workspace is removed
+        if cached is None:
+            cache.put(cache_key, response, result.get("output_files", []))
+
+    return response
+
+@app.post("/extract-data", status_code=202)
+def extract_data(req: ExtractRequest):
+    print("===== /extract-data called =====")
+    print("Request body:", req)
+
+    job_id = str(uuid.uuid4())
+
+    try:
+        manager.submit(job_id, run_extraction, req)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": "30"}
+        )
 
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+    }
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
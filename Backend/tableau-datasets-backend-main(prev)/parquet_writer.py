@@ -0,0 +1,107 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tableauhyperapi import TypeTag, Date, Timestamp
+
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+
+# ============================================================
+# HYPER → ARROW TYPES
+# ============================================================
+
+_SIMPLE_TYPES = {
+    TypeTag.BOOL: pa.bool_(),
+    TypeTag.SMALL_INT: pa.int16(),
+    TypeTag.INT: pa.int32(),
+    TypeTag.BIG_INT: pa.int64(),
+    TypeTag.OID: pa.uint32(),
+    TypeTag.FLOAT: pa.float32(),
+    TypeTag.DOUBLE: pa.float64(),
+    TypeTag.TEXT: pa.string(),
+    TypeTag.VARCHAR: pa.string(),
+    TypeTag.CHAR: pa.string(),
+    TypeTag.JSON: pa.string(),
+    TypeTag.DATE: pa.date32(),
+    TypeTag.TIME: pa.time64("us"),
+    TypeTag.TIMESTAMP: pa.timestamp("us"),
+    TypeTag.TIMESTAMP_TZ: pa.timestamp("us", tz="UTC"),
+    TypeTag.BYTES: pa.binary(),
+}
+
+
+def hyper_type_to_arrow(sql_type) -> pa.DataType:
+    if sql_type.tag == TypeTag.NUMERIC:
+        return pa.decimal128(sql_type.precision, sql_type.scale)
+    # Intervals, geography and anything new fall back to text
+    return _SIMPLE_TYPES.get(sql_type.tag, pa.string())
+
+
+def hyper_schema_to_arrow(columns: list, table_def) -> pa.Schema:
+    return pa.schema([
+        pa.field(name, hyper_type_to_arrow(col.type), nullable=True)
+        for name, col in zip(columns, table_def.columns)
+    ])
+
+# ============================================================
+# VALUE CONVERSION
+# ============================================================
+
+def _to_python(value):
+    # The Hyper API returns its own Date/Timestamp types
+    if isinstance(value, Timestamp):
+        return value.to_datetime()
+    if isinstance(value, Date):
+        return value.to_date()
+    return value
+
+
+def _to_text(value):
+    return None if value is None else str(value)
+
+
+def _column_converter(arrow_type: pa.DataType):
+    if pa.types.is_date(arrow_type) or pa.types.is_timestamp(arrow_type):
+        return _to_python
+    if pa.types.is_string(arrow_type):
+        return _to_text
+    return None
+
+
+def _rows_to_batch(rows: list, schema: pa.Schema, converters: list) -> pa.RecordBatch:
+    arrays = []
+    for i, field in enumerate(schema):
+        values = [row[i] for row in rows]
+        convert = converters[i]
+        if convert is not None:
+            values = [convert(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+# ============================================================
+# STREAMING WRITER
+# ============================================================
+
+def stream_query_to_parquet(conn, query: str, columns: list, table_def,
+                            parquet_path: str, chunk_size: int) -> int:
+    # Same chunked cursor read as the CSV export; each chunk becomes one
+    # Parquet row group typed from the Hyper table definition.
+    schema = hyper_schema_to_arrow(columns, table_def)
+    converters = [_column_converter(f.type) for f in schema]
+    rows_written = 0
+
+    with pq.ParquetWriter(parquet_path, schema, compression=PARQUET_COMPRESSION) as writer:
+        with conn.execute_query(query) as result:
+            chunk = []
+            for row in result:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    writer.write_batch(_rows_to_batch(chunk, schema, converters))
+                    rows_written += len(chunk)
+                    chunk.clear()
+
+            if chunk:
+                writer.write_batch(_rows_to_batch(chunk, schema, converters))
+                rows_written += len(chunk)
+
+    return rows_written
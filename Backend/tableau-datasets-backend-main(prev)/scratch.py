@@ -0,0 +1,171 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+SCRATCH_ROOT = os.getenv(
+    "SCRATCH_ROOT",
+    os.path.join(tempfile.gettempdir(), "extract-scratch")
+)
+SCRATCH_QUOTA_BYTES = int(os.getenv("SCRATCH_QUOTA_BYTES", str(20 * 1024 ** 3)))
+# How long a new job waits for disk space before giving up
+SCRATCH_WAIT_TIMEOUT = float(os.getenv("SCRATCH_WAIT_TIMEOUT", "600"))
+# Workspaces older than this are treated as timed out and removed
+SCRATCH_MAX_AGE = float(os.getenv("SCRATCH_MAX_AGE", "7200"))
+# Expected disk use per job, as a multiple of the TWBX size
+SCRATCH_EXPANSION_FACTOR = float(os.getenv("SCRATCH_EXPANSION_FACTOR", "3"))
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root_dir, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root_dir, name))
+            except OSError:
+                pass
+    return total
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# ============================================================
+# SCRATCH SPACE
+# ============================================================
+
+class ScratchSpace:
+    """
+    Hands out one working directory per job under SCRATCH_ROOT/<pid>/<job_id>
+    and removes it when the job ends, whether it succeeded or failed.
+
+    New workspaces wait until the disk quota has room for their
+    reservation (backpressure). Directories left behind by dead worker
+    processes, and this process's own workspaces older than
+    SCRATCH_MAX_AGE that no running job holds, are swept on every
+    admission. Live workers' workspaces are left to their owner.
+    """
+
+    def __init__(self, root: str = SCRATCH_ROOT,
+                 quota_bytes: int = SCRATCH_QUOTA_BYTES,
+                 wait_timeout: float = SCRATCH_WAIT_TIMEOUT,
+                 max_age: float = SCRATCH_MAX_AGE):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.wait_timeout = wait_timeout
+        self.max_age = max_age
+
+        self._proc_root = os.path.join(root, str(os.getpid()))
+        self._cond = threading.Condition()
+        self._reserved = {}  # workspace path -> reserved bytes
+
+    # -------- accounting --------
+
+    def usage(self) -> int:
+        return _dir_size(self.root) if os.path.isdir(self.root) else 0
+
+    def _committed(self) -> int:
+        # Other processes' files count as-is; our own workspaces count at
+        # least their reservation, since they have not finished writing yet.
+        own = 0
+        for path, reserved in self._reserved.items():
+            own += max(reserved, _dir_size(path))
+
+        others = 0
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if path != self._proc_root:
+                    others += _dir_size(path)
+
+        return own + others
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                "root": self.root,
+                "used_bytes": self.usage(),
+                "reserved_bytes": sum(self._reserved.values()),
+                "quota_bytes": self.quota_bytes,
+                "active_workspaces": len(self._reserved),
+            }
+
+    # -------- cleanup --------
+
+    def cleanup_stale(self):
+        if not os.path.isdir(self.root):
+            return
+
+        now = time.time()
+
+        for name in os.listdir(self.root):
+            proc_dir = os.path.join(self.root, name)
+
+            # Whole directory of a worker process that no longer exists
+            if name.isdigit() and not _pid_alive(int(name)):
+                shutil.rmtree(proc_dir, ignore_errors=True)
+                continue
+
+            # Another live worker's jobs: their mtime says nothing about
+            # whether an export is still writing, so only the owner sweeps
+            if proc_dir != self._proc_root or not os.path.isdir(proc_dir):
+                continue
+
+            for job_name in os.listdir(proc_dir):
+                path = os.path.join(proc_dir, job_name)
+                # Still in use by a running job; removed when it ends
+                if path in self._reserved:
+                    continue
+                try:
+                    age = now - os.path.getmtime(path)
+                except OSError:
+                    continue
+                if age > self.max_age:
+                    print("Removing timed out scratch workspace:", path)
+                    shutil.rmtree(path, ignore_errors=True)
+
+    # -------- workspaces --------
+
+    @contextmanager
+    def workspace(self, job_id: str, reserve_bytes: int = 0):
+        path = os.path.join(self._proc_root, job_id)
+        deadline = time.monotonic() + self.wait_timeout
+
+        with self._cond:
+            self.cleanup_stale()
+
+            # A lone job is always admitted so oversized inputs cannot deadlock
+            while self._reserved and \
+                    self._committed() + reserve_bytes > self.quota_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Timed out waiting for scratch disk space")
+                print("Scratch quota reached, waiting for disk space")
+                self._cond.wait(timeout=min(remaining, 5))
+                self.cleanup_stale()
+
+            os.makedirs(path, exist_ok=True)
+            self._reserved[path] = reserve_bytes
+
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            with self._cond:
+                self._reserved.pop(path, None)
+                self._cond.notify_all()
+
+
+scratch = ScratchSpace()
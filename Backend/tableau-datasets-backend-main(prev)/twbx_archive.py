@@ -0,0 +1,52 @@
+import zipfile
+
+
+class TwbxArchive:
+    """
+    Thin reader over a .twbx package. Looks up the .twb and .hyper members
+    from the zip central directory so only the files we need are read,
+    instead of unpacking images, fonts and other assets to disk.
+    """
+
+    def __init__(self, twbx_path: str):
+        self._zip = zipfile.ZipFile(twbx_path, "r")
+
+        self.twb_member = None
+        self.hyper_members = []
+
+        for info in self._zip.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+
+            name = info.filename.lower()
+            if name.endswith(".twb") and self.twb_member is None:
+                self.twb_member = info
+            elif name.endswith(".hyper"):
+                self.hyper_members.append(info)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    @property
+    def hyper_member(self):
+        return self.hyper_members[0] if self.hyper_members else None
+
+    def open_twb(self):
+        # Streams the workbook XML straight out of the archive
+        if self.twb_member is None:
+            raise ValueError("No .twb XML file found inside TWBX")
+        return self._zip.open(self.twb_member)
+
+    def extract_member(self, member: zipfile.ZipInfo, output_dir: str) -> str:
+        return self._zip.extract(member, output_dir)
+
+    def extract_hyper(self, output_dir: str) -> str:
+        if self.hyper_member is None:
+            raise RuntimeError("No .hyper file found inside TWBX")
+        return self.extract_member(self.hyper_member, output_dir)
@@ -1,19 +1,31 @@
 import json
 import os
-import zipfile
-import tempfile
-import re
-import xml.etree.ElementTree as ET
+from contextlib import asynccontextmanager
 from urllib.parse import unquote
 
 # Third-party imports
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from azure.core.exceptions import ResourceNotFoundError
 from azure.storage.blob import BlobClient
 
+from hyper_engine import engine
+from result_cache import cache
+from workbook_model import (
+    analyze_twbx, get_workbook_model, model_cache_key, normalize_table_name
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One hyperd per worker for reading extract catalogs
+    engine.start()
+    yield
+    engine.stop()
+
+
 # Initialize App
-app = FastAPI(title="Tableau Metadata Extractor API")
+app = FastAPI(title="Tableau Metadata Extractor API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,48 +39,15 @@ app.add_middleware(
 # CONSTANTS & MODELS
 # -------------------------------------------------
 
-MARK_MAP = {
-    'bar': 'Bar Chart',
-    'line': 'Line Chart',
-    'area': 'Area Chart',
-    'text': 'Text Table',
-    'circle': 'Scatter Plot',
-    'square': 'Heat Map',
-    'pie': 'Pie Chart',
-    'map': 'Map',
-    'ganttbar': 'Gantt Chart',
-    'shape': 'Shape Chart',
-    'scatter': 'Scatter Plot',
-    'multipolygon': 'Map',
-    'filledmap': 'Map'
-}
-
 class ExtractMetadataRequest(BaseModel):
     inputBlobUrl: str
     outputContainerUrl: str
+    skipIfUnchanged: bool = False
 
 # -------------------------------------------------
 # HELPERS
 # -------------------------------------------------
 
-def clean_name(name: str) -> str:
-    """
-    Cleans Tableau field names.
-    """
-    if not name:
-        return ""
-    
-    # 1. Remove brackets
-    name = name.replace("[", "").replace("]", "")
-    
-    # 2. Remove Tableau internal patterns (start prefixes)
-    name = re.sub(r'^(none|sum|avg|min|max|count|attr|yr|mn|dy|qd|tdc):', '', name, flags=re.IGNORECASE)
-    
-    # 3. Remove internal suffixes
-    name = re.sub(r':(nk|ok|qk|sk)$', '', name, flags=re.IGNORECASE)
-    
-    return name
-
 def get_blob_client(blob_url: str):
     """
     Helper to get a BlobClient. 
@@ -104,7 +83,7 @@ def download_blob_to_file(blob_url: str, local_path: str):
         data = blob.download_blob()
         data.readinto(f)
 
-def upload_json_to_blob(container_url: str, blob_name: str, data: dict) -> str:
+def get_output_blob_client(container_url: str, blob_name: str) -> BlobClient:
     conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
     if not conn_str:
         raise ValueError("AZURE_STORAGE_CONNECTION_STRING environment variable not set")
@@ -113,169 +92,89 @@ def upload_json_to_blob(container_url: str, blob_name: str, data: dict) -> str:
     # container_url input might be https://account.blob.core.windows.net/container
     container_name = container_url.rstrip("/").split("/")[-1]
     
-    blob = BlobClient.from_connection_string(
+    return BlobClient.from_connection_string(
         conn_str=conn_str,
         container_name=container_name,
         blob_name=blob_name
     )
+
+def upload_json_to_blob(container_url: str, blob_name: str, data: dict,
+                        metadata: dict = None) -> str:
+    blob = get_output_blob_client(container_url, blob_name)
     blob.upload_blob(
         json.dumps(data, indent=2),
         overwrite=True,
-        content_type="application/json"
+        content_type="application/json",
+        metadata=metadata
     )
     return blob.url
 
+def output_matches(blob: BlobClient, source_etag: str) -> bool:
+    """
+    True when the output blob was written from this exact TWBX version.
+    """
+    try:
+        props = blob.get_blob_properties()
+    except ResourceNotFoundError:
+        return False
+    return props.metadata.get("source_etag") == source_etag
+
 # -------------------------------------------------
 # CORE EXTRACTION LOGIC
 # -------------------------------------------------
 
-def extract_tableau_metadata(twbx_path: str) -> dict:
+def model_to_metadata(model: dict) -> dict:
+    """
+    Shapes the shared workbook model into the /extract-metadata output.
+    Datasource tables carry their typed columns from the extract and
+    worksheet columns name the table that owns them.
+    """
     metadata = {
         "dataSource": {},
-        "calculatedFields": [],
-        "worksheets": [],
-        "dashboards": [],
+        "calculatedFields": model["calculatedFields"],
+        "worksheets": model["worksheets"],
+        "dashboards": model["dashboards"],
         "globalFilters": []
     }
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # A. Unzip TWBX
-        try:
-            with zipfile.ZipFile(twbx_path, "r") as zip_ref:
-                zip_ref.extractall(tmpdir)
-        except zipfile.BadZipFile:
-            raise ValueError("File is not a valid .twbx zip file")
-
-        # B. Find .twb XML
-        twb_file = None
-        for root_dir, _, files in os.walk(tmpdir):
-            for file in files:
-                if file.endswith(".twb"):
-                    twb_file = os.path.join(root_dir, file)
-                    break
-        
-        if not twb_file:
-            raise ValueError("No .twb XML file found inside TWBX")
-
-        # C. Parse XML & STRIP NAMESPACES
-        try:
-            tree = ET.parse(twb_file)
-            root = tree.getroot()
-        except ET.ParseError:
-            raise ValueError("Failed to parse .twb XML content")
-        
-        # Namespace stripping
-        for elem in root.iter():
-            if '}' in elem.tag:
-                elem.tag = elem.tag.split('}', 1)[1]
-
-        # 1. DATASOURCE
-        datasource = root.find(".//datasource")
-        if datasource is not None:
-            tables = []
-            for relation in datasource.findall(".//relation"):
-                table_name = relation.get("table")
-                if not table_name: 
-                    continue
-                
-                tables.append({
-                    "tableName": clean_name(table_name),
-                    "columns": [] 
-                })
-
-            metadata["dataSource"] = {
-                "name": datasource.get("name") or "TableauData",
-                "type": "extract",
-                "tables": tables
-            }
-
-        # 2. CALCULATED FIELDS
-        for col in root.findall(".//column"):
-            calc = col.find("calculation")
-            if calc is not None:
-                metadata["calculatedFields"].append({
-                    "name": clean_name(col.get("name")),
-                    "expression": calc.get("formula")
-                })
-
-        # 3. WORKSHEETS
-        for worksheet in root.findall(".//worksheet"):
-            sheet_name = worksheet.get('name')
-            bound_columns_set = set()
-
-            # Dependency Detection
-            for dep in worksheet.findall(".//datasource-dependencies"):
-                for col in dep.findall("column-instance"):
-                    col_ref = col.get('column')
-                    clean_col = None
-                    
-                    if col_ref:
-                        # [some_table].[column_name] -> column_name
-                        parts = col_ref.split(']:')
-                        if len(parts) > 1:
-                            clean_col = clean_name(parts[-1])
-                    
-                    if not clean_col: 
-                        clean_col = clean_name(col.get('name'))
-                        
-                    if clean_col:
-                        bound_columns_set.add(clean_col)
-
-            # Smart Visual Detection
-            visual_type = "Automatic"
-            
-            # A. Check Marks
-            for mark_element in worksheet.findall(".//pane/mark"):
-                cls = mark_element.get('class')
-                if cls and cls != "Automatic":
-                    visual_type = MARK_MAP.get(cls.lower(), cls.capitalize())
-                    break
-            
-            # B. Check Style Rules
-            if visual_type == "Automatic":
-                if worksheet.find(".//style-rule[@element='map']") is not None:
-                    visual_type = "Map"
-                elif worksheet.find(".//style-rule[@element='table']") is not None:
-                    visual_type = "Text Table"
-            
-            # C. Guess based on columns
-            if visual_type == "Automatic":
-                col_list_lower = [c.lower() for c in bound_columns_set]
-                map_keywords = ['lat', 'lon', 'country', 'city', 'state', 'zip', 'geo']
-                
-                if any(k in col for col in col_list_lower for k in map_keywords):
-                    visual_type = "Map"
-                elif len(bound_columns_set) == 1:
-                    visual_type = "Text Table"
-                else:
-                    visual_type = "Bar Chart"
-
-            formatted_columns = [
-                {"table": "MainTable", "column": col} 
-                for col in sorted(list(bound_columns_set))
-            ]
-
-            metadata["worksheets"].append({
-                "name": sheet_name,
-                "visualType": visual_type, 
-                "columns": formatted_columns
+    datasource = model["dataSource"]
+    if datasource is not None:
+        extract_tables = model["tables"]
+        by_name = {name.lower(): name for name in extract_tables}
+        relations = datasource["relations"]
+
+        tables = []
+        for relation in relations:
+            # "Extract.Orders" -> "orders"
+            key = normalize_table_name(relation.split(".")[-1]).lower()
+            match = by_name.get(key)
+            if match is None and len(relations) == 1 and len(extract_tables) == 1:
+                match = next(iter(extract_tables))
+
+            columns = []
+            if match is not None:
+                columns = [
+                    {"name": col, "dataType": data_type}
+                    for col, data_type in extract_tables[match]["columns"].items()
+                ]
+
+            tables.append({
+                "tableName": relation,
+                "columns": columns
             })
 
-        # 4. DASHBOARDS
-        for dashboard in root.findall(".//dashboard"):
-            ws_names = []
-            for zone in dashboard.findall(".//zone"):
-                z_name = zone.get("name")
-                if z_name:
-                    ws_names.append(z_name)
-            
-            metadata["dashboards"].append({
-                "dashboardName": dashboard.get("name"),
-                "worksheets": list(set(ws_names))
-            })
+        metadata["dataSource"] = {
+            "name": datasource["name"],
+            "type": "extract",
+            "tables": tables
+        }
 
     return metadata
 
+
+def extract_tableau_metadata(twbx_path: str) -> dict:
+    return model_to_metadata(analyze_twbx(twbx_path))
+
 # -------------------------------------------------
 # API ENDPOINT
 # -------------------------------------------------
@@ -283,29 +182,45 @@ def extract_tableau_metadata(twbx_path: str) -> dict:
 @app.post("/extract-metadata")
 def handle_extraction(payload: ExtractMetadataRequest):
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            local_twbx = os.path.join(tmpdir, "input.twbx")
-            
-            # Download
-            download_blob_to_file(payload.inputBlobUrl, local_twbx)
-            
-            # Extract
-            metadata = extract_tableau_metadata(local_twbx)
-            
-            # Upload
-            base_name = unquote(os.path.basename(payload.inputBlobUrl))
-            output_name = os.path.splitext(base_name)[0] + "_metadata.json"
-            
-            output_url = upload_json_to_blob(
-                payload.outputContainerUrl,
-                output_name,
-                metadata
-            )
+        base_name = unquote(os.path.basename(payload.inputBlobUrl))
+        output_name = os.path.splitext(base_name)[0] + "_metadata.json"
+
+        # Workbook model key: source container/blob + current ETag
+        input_blob = BlobClient.from_blob_url(payload.inputBlobUrl)
+        etag = input_blob.get_blob_properties().etag.strip('"')
+        source = (input_blob.container_name, input_blob.blob_name, etag)
+
+        if payload.skipIfUnchanged:
+            output_blob = get_output_blob_client(payload.outputContainerUrl, output_name)
+            if output_matches(output_blob, etag):
+                cached = cache.get(model_cache_key(*source))
+                return {
+                    "status": "success",
+                    "outputBlobUrl": output_blob.url,
+                    "visuals_found": len(cached[0]["worksheets"]) if cached else None,
+                    "skipped": True
+                }
+
+        # Shared with /migrate-static: only the first caller parses the TWBX
+        model, model_source = get_workbook_model(
+            *source,
+            lambda local_path: download_blob_to_file(payload.inputBlobUrl, local_path)
+        )
+        metadata = model_to_metadata(model)
+
+        # Upload
+        output_url = upload_json_to_blob(
+            payload.outputContainerUrl,
+            output_name,
+            metadata,
+            metadata={"source_etag": etag}
+        )
             
         return {
             "status": "success",
             "outputBlobUrl": output_url,
-            "visuals_found": len(metadata["worksheets"])
+            "visuals_found": len(metadata["worksheets"]),
+            "cached": model_source != "built"
         }
 
     except Exception as e:
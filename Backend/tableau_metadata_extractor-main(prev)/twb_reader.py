@@ -0,0 +1,71 @@
+import xml.etree.ElementTree as ET
+
+
+def local_name(tag: str) -> str:
+    return tag.split("}", 1)[1] if "}" in tag else tag
+
+
+class TwbReader:
+    """
+    Single-pass .twb reader built on iterparse. Handlers are registered
+    for a tag path suffix, e.g. "worksheets/worksheet" or
+    "object-graph/relationships/relationship", and are called with the
+    complete element once its end tag is read. Namespaces are stripped as
+    elements arrive.
+
+    Anything not inside a registered element is discarded as soon as it
+    ends, and handled elements are cleared after their handlers run, so
+    memory stays bounded by the largest handled subtree rather than the
+    whole workbook (thumbnails, window state, ...).
+    """
+
+    def __init__(self):
+        self._handlers = []  # (path tuple, handler)
+
+    def on(self, path: str, handler):
+        self._handlers.append((tuple(path.strip("/").split("/")), handler))
+        return self
+
+    def _matches(self, tags: list) -> list:
+        return [
+            handler for path, handler in self._handlers
+            if tuple(tags[-len(path):]) == path
+        ]
+
+    def parse(self, source):
+        """
+        source: path or binary file object (e.g. TwbxArchive.open_twb()).
+        Raises xml.etree.ElementTree.ParseError on malformed XML.
+        """
+        tags = []       # tag path of the current element
+        parents = []    # open elements, parallel to tags
+        matched = []    # handlers for each open element
+        captured = 0    # open elements that are kept for a handler
+
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                elem.tag = local_name(elem.tag)
+                tags.append(elem.tag)
+                parents.append(elem)
+                handlers = self._matches(tags)
+                matched.append(handlers)
+                if handlers:
+                    captured += 1
+                continue
+
+            handlers = matched.pop()
+            tags.pop()
+            parents.pop()
+
+            for handler in handlers:
+                handler(elem)
+
+            if handlers:
+                captured -= 1
+
+            if captured == 0:
+                # Nobody above needs this subtree any more
+                elem.clear()
+                if parents:
+                    # Just closed, so it is the parent's last child
+                    del parents[-1][-1]
@@ -0,0 +1,529 @@
+
+
+
+import os
+import re
+import gzip
+import json
+import zipfile
+import tempfile
+import logging
+import xml.etree.ElementTree as ET
+from typing import Dict, List
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from tableauhyperapi import HyperException, Name, TableName
+
+from hyper_engine import engine
+from pbi_types import INT64, STRING, hyper_type_to_pbi, is_key_name
+from result_cache import cache
+from twbx_archive import TwbxArchive
+from twb_reader import TwbReader
+
+# ============================================================
+# LOGGING
+# ============================================================
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger("tableau-metadata")
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+# Bump when the model layout changes; old stored models are then ignored
+MODEL_VERSION = 1
+WORKBOOK_MODEL_CONTAINER = os.getenv("WORKBOOK_MODEL_CONTAINER", "workbook-models")
+
+# Rows sampled per column when profiling candidate keys
+KEY_SAMPLE_ROWS = int(os.getenv("KEY_SAMPLE_ROWS", "10000"))
+# Distinct share needed for the "one" side of a relationship
+KEY_MIN_UNIQUENESS = float(os.getenv("KEY_MIN_UNIQUENESS", "0.99"))
+# Share of "many" side values that must exist on the "one" side
+KEY_MIN_CONTAINMENT = float(os.getenv("KEY_MIN_CONTAINMENT", "0.9"))
+# Doubles, dates and booleans are never treated as keys
+KEY_TYPES = {INT64, STRING}
+
+MARK_MAP = {
+    'bar': 'Bar Chart',
+    'line': 'Line Chart',
+    'area': 'Area Chart',
+    'text': 'Text Table',
+    'circle': 'Scatter Plot',
+    'square': 'Heat Map',
+    'pie': 'Pie Chart',
+    'map': 'Map',
+    'ganttbar': 'Gantt Chart',
+    'shape': 'Shape Chart',
+    'scatter': 'Scatter Plot',
+    'multipolygon': 'Map',
+    'filledmap': 'Map'
+}
+
+MAP_KEYWORDS = ['lat', 'lon', 'country', 'city', 'state', 'zip', 'geo']
+
+# Worksheet columns not found in the extract (e.g. calculations)
+DEFAULT_TABLE = "MainTable"
+
+# ============================================================
+# UTILS
+# ============================================================
+
+def clean(val: str) -> str:
+    if not val:
+        return ""
+    return re.sub(r'[\[\]"]', "", val).strip()
+
+
+def clean_name(name: str) -> str:
+    """
+    Cleans Tableau field names: brackets, aggregation prefixes
+    (sum:, none:, ...) and type suffixes (:nk, :qk, ...).
+    """
+    if not name:
+        return ""
+    name = name.replace("[", "").replace("]", "")
+    name = re.sub(r'^(none|sum|avg|min|max|count|attr|yr|mn|dy|qd|tdc):', '', name, flags=re.IGNORECASE)
+    name = re.sub(r':(nk|ok|qk|sk)$', '', name, flags=re.IGNORECASE)
+    return name
+
+
+def normalize_table_name(name: str) -> str:
+    name = clean(name)
+    if ".csv_" in name:
+        return name.split(".csv_", 1)[0]
+    return name
+
+# ============================================================
+# STEP 1: HYPER — TABLES & COLUMN MAP
+# ============================================================
+
+def extract_hyper_metadata(hyper_path: str):
+    tables: Dict[str, List[str]] = {}
+    column_table_map: Dict[str, List[str]] = {}
+    # table -> column -> Power BI push type
+    column_types: Dict[str, Dict[str, str]] = {}
+
+    with engine.connect(hyper_path) as conn:
+        for schema in conn.catalog.get_schema_names():
+            for table in conn.catalog.get_table_names(schema):
+                table_name = normalize_table_name(str(table.name))
+                cols = []
+                types = column_types.setdefault(table_name, {})
+
+                table_def = conn.catalog.get_table_definition(table)
+                for c in table_def.columns:
+                    col = clean(str(c.name))
+                    cols.append(col)
+                    types[col] = hyper_type_to_pbi(c.type)
+                    column_table_map.setdefault(col, []).append(table_name)
+
+                tables[table_name] = cols
+
+    return tables, column_table_map, column_types
+
+# ============================================================
+# STEP 2: TWB — DATASOURCE, CALCS, SHEETS, DASHBOARDS, RELATIONSHIPS
+# ============================================================
+
+def _worksheet_columns(worksheet) -> set:
+    columns = set()
+
+    for dep in worksheet.iter("datasource-dependencies"):
+        for col in dep.findall("column-instance"):
+            col_ref = col.get('column')
+            clean_col = None
+
+            if col_ref:
+                # [some_table].[column_name] -> column_name
+                parts = col_ref.split(']:')
+                if len(parts) > 1:
+                    clean_col = clean_name(parts[-1])
+
+            if not clean_col:
+                clean_col = clean_name(col.get('name'))
+
+            if clean_col:
+                columns.add(clean_col)
+
+    return columns
+
+
+def _visual_type(worksheet, columns: set) -> str:
+    # A. Marks
+    for mark_element in worksheet.findall(".//pane/mark"):
+        cls = mark_element.get('class')
+        if cls and cls != "Automatic":
+            return MARK_MAP.get(cls.lower(), cls.capitalize())
+
+    # B. Style rules
+    if worksheet.find(".//style-rule[@element='map']") is not None:
+        return "Map"
+    if worksheet.find(".//style-rule[@element='table']") is not None:
+        return "Text Table"
+
+    # C. Guess from the bound columns
+    if any(k in col.lower() for col in columns for k in MAP_KEYWORDS):
+        return "Map"
+    if len(columns) == 1:
+        return "Text Table"
+    return "Bar Chart"
+
+
+def read_twb(twb_stream) -> dict:
+    """
+    Single iterparse pass over the TWB collecting everything the model
+    needs from the XML.
+    """
+    twb = {
+        "dataSource": None,
+        "calculatedFields": [],
+        "worksheets": [],
+        "dashboards": [],
+        "xmlRelationships": [],
+    }
+
+    def on_datasource(datasource):
+        # The first datasource with tables (skips e.g. "Parameters")
+        current = twb["dataSource"]
+        if current is not None and current["relations"]:
+            return
+        relations = [
+            clean_name(r.get("table"))
+            for r in datasource.iter("relation") if r.get("table")
+        ]
+        if current is None or relations:
+            twb["dataSource"] = {
+                "name": datasource.get("name") or "TableauData",
+                "relations": relations,
+            }
+
+    def on_column(col):
+        calc = col.find("calculation")
+        if calc is not None:
+            twb["calculatedFields"].append({
+                "name": clean_name(col.get("name")),
+                "expression": calc.get("formula")
+            })
+
+    def on_worksheet(worksheet):
+        columns = _worksheet_columns(worksheet)
+        twb["worksheets"].append({
+            "name": worksheet.get("name"),
+            "visualType": _visual_type(worksheet, columns),
+            "columns": sorted(columns),
+        })
+
+    def on_dashboard(dashboard):
+        names = {z.get("name") for z in dashboard.iter("zone") if z.get("name")}
+        twb["dashboards"].append({
+            "dashboardName": dashboard.get("name"),
+            "worksheets": list(names)
+        })
+
+    def on_relationship(rel):
+        expr = rel.find("expression")
+        if expr is None:
+            return
+
+        cols = [clean(e.get("op")) for e in expr.findall("expression")]
+        if len(cols) == 2:
+            twb["xmlRelationships"].append(cols)
+
+    reader = TwbReader()
+    reader.on("workbook/datasources/datasource", on_datasource)
+    reader.on("column", on_column)
+    reader.on("worksheets/worksheet", on_worksheet)
+    reader.on("dashboards/dashboard", on_dashboard)
+    reader.on("object-graph/relationships/relationship", on_relationship)
+    reader.parse(twb_stream)
+    return twb
+
+# ============================================================
+# STEP 3: RELATIONSHIPS (FINAL FORMAT)
+# ============================================================
+
+def extract_relationships(xml_pairs, column_table_map, hyper_path: str = None,
+                          column_types: Dict[str, Dict[str, str]] = None):
+    relationships = []
+    seen = set()
+
+    def add(from_t, from_c, to_t, to_c, rel_type="Many-to-One"):
+        key = (from_t, from_c, to_t, to_c)
+        if key in seen:
+            return
+        seen.add(key)
+        relationships.append({
+            "fromTable": from_t.lower(),
+            "fromColumn": from_c,
+            "toTable": to_t.lower(),
+            "toColumn": to_c,
+            "relationshipType": rel_type
+        })
+
+    # -------- XML relationships --------
+    for left, right in xml_pairs:
+        lt = column_table_map.get(left, [])
+        rt = column_table_map.get(right, [])
+
+        if lt and rt:
+            add(lt[0], left, rt[0], right)
+
+    # -------- Fallback: profiled shared key columns --------
+    if not relationships and hyper_path:
+        for rel in infer_relationships(hyper_path, column_table_map, column_types or {}):
+            add(rel["fromTable"], rel["fromColumn"], rel["toTable"],
+                rel["toColumn"], rel["relationshipType"])
+
+    return relationships
+
+# ============================================================
+# STEP 3b: DATA-DRIVEN KEY DETECTION
+# ============================================================
+
+def _table_refs(conn) -> Dict[str, TableName]:
+    refs = {}
+    for schema in conn.catalog.get_schema_names():
+        for table in conn.catalog.get_table_names(schema):
+            refs[normalize_table_name(str(table.name))] = table
+    return refs
+
+
+def _uniqueness(conn, table: TableName, col: str, sample_rows: int) -> float:
+    # Distinct share of the non-null values in a sample of the column
+    non_null, distinct = conn.execute_list_query(
+        f"SELECT COUNT(v), COUNT(DISTINCT v) FROM "
+        f"(SELECT {Name(col)} AS v FROM {table} LIMIT {sample_rows}) s"
+    )[0]
+    return distinct / non_null if non_null else 0.0
+
+
+def _containment(conn, many: TableName, one: TableName, col: str,
+                 sample_rows: int) -> float:
+    # Share of sampled "many" values that exist on the "one" side; compared
+    # as text so differently typed copies of a key still match
+    total, matched = conn.execute_list_query(
+        f"SELECT COUNT(*), COUNT(o.v) FROM "
+        f"(SELECT DISTINCT CAST({Name(col)} AS TEXT) AS v FROM {many} "
+        f"WHERE {Name(col)} IS NOT NULL LIMIT {sample_rows}) s "
+        f"LEFT JOIN (SELECT DISTINCT CAST({Name(col)} AS TEXT) AS v FROM {one}) o "
+        f"ON s.v = o.v"
+    )[0]
+    return matched / total if total else 0.0
+
+
+def infer_relationships(hyper_path: str, column_table_map: Dict[str, List[str]],
+                        column_types: Dict[str, Dict[str, str]],
+                        sample_rows: int = KEY_SAMPLE_ROWS) -> List[dict]:
+    """
+    Relationships for columns shared by several tables, found through the
+    column -> tables index. A table is the "one" side when the column is
+    (nearly) unique in its sample, and another table is linked to it when
+    most of its sampled values occur there. At most one relationship per
+    table pair: key-like names first, then the best containment.
+    """
+    best = {}
+
+    with engine.connect(hyper_path) as conn:
+        refs = _table_refs(conn)
+
+        for col, col_tables in column_table_map.items():
+            candidates = sorted({
+                t for t in col_tables
+                if t in refs and
+                column_types.get(t, {}).get(col, STRING) in KEY_TYPES
+            })
+            if len(candidates) < 2:
+                continue
+
+            try:
+                uniqueness = {
+                    t: _uniqueness(conn, refs[t], col, sample_rows)
+                    for t in candidates
+                }
+
+                ones = [t for t in candidates if uniqueness[t] >= KEY_MIN_UNIQUENESS]
+                if not ones:
+                    continue
+
+                # Every other table links to a single "one" table so the
+                # model has no ambiguous filter paths for this column
+                one = ones[0]
+                for many in candidates:
+                    if many == one:
+                        continue
+
+                    containment = _containment(
+                        conn, refs[many], refs[one], col, sample_rows
+                    )
+                    if containment < KEY_MIN_CONTAINMENT:
+                        continue
+
+                    pair = tuple(sorted((many, one)))
+                    score = (is_key_name(col), containment)
+                    if pair not in best or score > best[pair][0]:
+                        best[pair] = (score, {
+                            "fromTable": many,
+                            "fromColumn": col,
+                            "toTable": one,
+                            "toColumn": col,
+                            "relationshipType":
+                                "One-to-One" if many in ones else "Many-to-One",
+                        })
+            except HyperException as e:
+                log.warning(f"Skipping key profiling for column {col}: {e}")
+
+    return [rel for _, rel in best.values()]
+
+# ============================================================
+# STEP 4: COMBINED MODEL
+# ============================================================
+
+def _owner_table(col: str, column_table_map: Dict[str, List[str]]) -> str:
+    tables = column_table_map.get(col)
+    return tables[0].lower() if tables else DEFAULT_TABLE
+
+
+def analyze_twbx(twbx_path: str) -> dict:
+    """
+    Reads the TWB and the Hyper catalog once and returns the workbook
+    model shared by /extract-metadata and /migrate-static:
+    tables (typed columns), columnTables, relationships, dataSource,
+    calculatedFields, worksheets and dashboards. "tables" is empty when
+    the workbook has no extract.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            archive = TwbxArchive(twbx_path)
+        except zipfile.BadZipFile:
+            raise ValueError("File is not a valid .twbx zip file")
+
+        with archive:
+            try:
+                with archive.open_twb() as twb_stream:
+                    twb = read_twb(twb_stream)
+            except ET.ParseError:
+                raise ValueError("Failed to parse .twb XML content")
+
+            hyper = archive.extract_hyper(tmp) if archive.hyper_member else None
+
+        column_types, col_map = {}, {}
+        if hyper:
+            _, col_map, column_types = extract_hyper_metadata(hyper)
+
+        relationships = extract_relationships(
+            twb["xmlRelationships"], col_map, hyper, column_types
+        )
+
+    worksheets = [
+        {
+            "name": ws["name"],
+            "visualType": ws["visualType"],
+            "columns": [
+                {"table": _owner_table(col, col_map), "column": col}
+                for col in ws["columns"]
+            ],
+        }
+        for ws in twb["worksheets"]
+    ]
+
+    return {
+        "version": MODEL_VERSION,
+        "dataSource": twb["dataSource"],
+        "tables": {
+            table: {"columns": types} for table, types in column_types.items()
+        },
+        "columnTables": col_map,
+        "relationships": relationships,
+        "calculatedFields": twb["calculatedFields"],
+        "worksheets": worksheets,
+        "dashboards": twb["dashboards"],
+    }
+
+# ============================================================
+# STEP 5: MODEL STORE (BLOB + LOCAL CACHE)
+# ============================================================
+
+_model_container = None
+
+
+def _get_model_container():
+    global _model_container
+    if _model_container is None:
+        service = BlobServiceClient.from_connection_string(
+            os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+        )
+        container = service.get_container_client(WORKBOOK_MODEL_CONTAINER)
+        try:
+            container.create_container()
+        except ResourceExistsError:
+            pass
+        _model_container = container
+    return _model_container
+
+
+def model_blob_name(source_container: str, source_blob: str, etag: str) -> str:
+    return f"{source_container}/{source_blob}/{etag}.v{MODEL_VERSION}.json.gz"
+
+
+def load_model(blob_name: str):
+    try:
+        data = _get_model_container().download_blob(blob_name).readall()
+    except ResourceNotFoundError:
+        return None
+    return json.loads(gzip.decompress(data))
+
+
+def save_model(blob_name: str, model: dict):
+    body = gzip.compress(
+        json.dumps(model, separators=(",", ":")).encode("utf-8")
+    )
+    _get_model_container().upload_blob(
+        blob_name,
+        body,
+        overwrite=True,
+        content_settings=ContentSettings(content_type="application/gzip"),
+    )
+
+
+def model_cache_key(source_container: str, source_blob: str, etag: str) -> str:
+    return cache.key(source_container, source_blob, etag, "workbook-model", MODEL_VERSION)
+
+
+def get_workbook_model(source_container: str, source_blob: str, etag: str,
+                       fetch):
+    """
+    Model for one TWBX version. Looked up in the local result cache, then
+    in WORKBOOK_MODEL_CONTAINER (written by whichever service analysed the
+    workbook first); otherwise built with fetch(local_path), which must
+    download the TWBX to local_path, and stored in both.
+
+    Returns (model, source) with source "cache", "blob" or "built".
+    """
+    cache_key = model_cache_key(source_container, source_blob, etag)
+    cached = cache.get(cache_key)
+    if cached:
+        return cached[0], "cache"
+
+    blob_name = model_blob_name(source_container, source_blob, etag)
+    model = load_model(blob_name)
+    source = "blob"
+
+    if model is None:
+        source = "built"
+        with tempfile.TemporaryDirectory() as tmp:
+            twbx_path = os.path.join(tmp, "input.twbx")
+            fetch(twbx_path)
+            model = analyze_twbx(twbx_path)
+
+        try:
+            save_model(blob_name, model)
+        except Exception:
+            # The model is still usable; the other service rebuilds it
+            log.exception("Failed to store workbook model %s", blob_name)
+    else:
+        log.info("Loaded workbook model %s", blob_name)
+
+    cache.put(cache_key, model)
+    return model, source